@@ -0,0 +1,164 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import concurrent.futures
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import corpus
+import torah
+import translation
+import workers
+
+# Costs are counted in selected letters, each about a microsecond of ELS, gematria and serialization work.
+# TRANSLATION_CALL_COST is the cost of one translator call, texts over the Google length limit take one call per piece.
+TRANSLATION_CALL_COST = int(os.environ.get("TRANSLATION_CALL_COST", "1000"))
+# Searches up to this cost run on the fast lane, the pool that serves the default traffic
+FAST_LANE_MAX_COST = int(os.environ.get("FAST_LANE_MAX_COST", "100000"))
+# Searches above this cost are rejected
+SEARCH_COST_LIMIT = int(os.environ.get("SEARCH_COST_LIMIT", "2000000"))
+# Sweeps above this cost are rejected, a sweep is streamed from the request thread
+SWEEP_COST_LIMIT = int(os.environ.get("SWEEP_COST_LIMIT", "1000000"))
+# Expensive searches admitted at once per worker process, running or waiting for a background pool process.
+# Each one holds a request thread of a gthread worker until it is done, so this must stay below --threads;
+# by default only as many as the background pool runs are admitted and no thread waits for a busy pool.
+BACKGROUND_QUEUE_SIZE = int(os.environ.get("BACKGROUND_QUEUE_SIZE", str(workers.BACKGROUND_WORKERS)))
+# Seconds a request waits for its background search, then it is answered with 503 and gives up its slot
+BACKGROUND_TIMEOUT = float(os.environ.get("BACKGROUND_TIMEOUT", "120"))
+
+FAST_LANE = "fast"
+BACKGROUND_LANE = "background"
+
+# Estimated work of a search: letters selected by the ELS, texts sent to the translator and both in cost units
+SearchCost = namedtuple("SearchCost", ["letters", "translation_calls", "total"])
+
+_background_slots = threading.BoundedSemaphore(BACKGROUND_QUEUE_SIZE)
+
+
+class TooExpensive(Exception):
+    """The estimated cost of a search is over SEARCH_COST_LIMIT."""
+
+
+class Busy(Exception):
+    """All background slots are taken, the client should retry later."""
+
+
+def selected_letters(text_length, step, rounds, limit=0):
+    """Letters per round that process_book selects from a text of text_length letters, without selecting them."""
+    counts = []
+    seen_rounds = set()
+    collected = 0
+    for round_num in map(int, rounds.split(',')):
+        # Same rules as process_book and process_corpus
+        if (abs(round_num) == 1 and step > text_length) or round_num in seen_rounds:
+            continue
+        seen_rounds.add(round_num)
+        if limit and collected >= limit:
+            break
+        count = torah.round_length(text_length, step, round_num)
+        if limit:
+            count = min(count, limit - collected)
+        counts.append(count)
+        collected += count
+    return counts
+
+
+def translation_calls(text_length):
+    """Translator calls for a text of text_length letters, GoogleBatchTranslator splits longer texts into pieces."""
+    return -(-text_length // translation.GOOGLE_MAX_CHARS)
+
+
+def estimate(step, start, end, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk,
+             whole_corpus=False, average_compile=False, translate=True):
+    """Estimates the work of an /els_search before running it, takes the keys of app.DEFAULT_SEARCH.
+
+    Only the book lengths are read, so an estimate costs no more than looking up the cleaned books.
+    """
+    lengths = [corpus.letter_count(number, strip_spaces, strip_in_braces, strip_diacritics_chk) for number in range(start, end + 1)]
+    if whole_corpus:
+        counts = [selected_letters(sum(lengths), step, rounds, length)]
+        texts = counts[0]  # One result per round
+    else:
+        # Average compile folds all rounds, so the rounds are not cut to length
+        counts = [selected_letters(text_length, step, rounds, 0 if average_compile else length) for text_length in lengths]
+        if average_compile:
+            # An averaged letter is written with up to three characters, the text is then cut to length
+            widest = max(map(len, torah.value_strings()))
+            texts = [max(book_counts, default=0) * widest for book_counts in counts]
+            texts = [min(text_length, length) for text_length in texts] if length else texts
+        else:
+            texts = [sum(book_counts) for book_counts in counts]
+    letters = sum(map(sum, counts))
+    calls = sum(map(translation_calls, texts)) if translate else 0
+    return SearchCost(letters, calls, letters + calls * TRANSLATION_CALL_COST)
+
+
+def batch_cost(steps, search):
+    """Estimated work of an /els_search/batch: the letters of its distinct steps added up.
+
+    All texts of a batch are translated in one translator batch, which joins them into as few calls as
+    the Google length limit allows.
+    """
+    letters = sum(estimate(step, translate=False, **search).letters for step in dict.fromkeys(steps))
+    calls = translation_calls(letters)
+    return SearchCost(letters, calls, letters + calls * TRANSLATION_CALL_COST)
+
+
+def check_sweep(step_from, step_to, search, translate=False):
+    """Estimates an /els_search/sweep, raises TooExpensive if it is over SWEEP_COST_LIMIT.
+
+    Smaller steps select more letters, so every step is estimated like step_from. Each step is translated
+    in one translator batch.
+    """
+    letters = estimate(step_from, translate=False, **search).letters
+    calls = translation_calls(letters) if translate else 0
+    steps = step_to - step_from + 1
+    cost = SearchCost(letters * steps, calls * steps, (letters + calls * TRANSLATION_CALL_COST) * steps)
+    if cost.total > SWEEP_COST_LIMIT:
+        raise TooExpensive(f"Sweep too expensive: estimated cost {cost.total} ({cost.letters} letters, "
+                           f"{cost.translation_calls} translations) exceeds the limit of {SWEEP_COST_LIMIT}.")
+    return cost
+
+
+def lane(cost):
+    """Returns the lane a search of this cost runs on, raises TooExpensive if it is over SEARCH_COST_LIMIT."""
+    if cost.total > SEARCH_COST_LIMIT:
+        raise TooExpensive(f"Search too expensive: estimated cost {cost.total} ({cost.letters} letters, "
+                           f"{cost.translation_calls} translations) exceeds the limit of {SEARCH_COST_LIMIT}.")
+    return FAST_LANE if cost.total <= FAST_LANE_MAX_COST else BACKGROUND_LANE
+
+
+def search_lane(step, search, whole_corpus=False, average_compile=False):
+    """Estimates an /els_search with the parameters of app.parse_search and returns its lane, see lane."""
+    return lane(estimate(step, whole_corpus=whole_corpus, average_compile=average_compile, **search))
+
+
+@contextmanager
+def background_slot():
+    """Holds one of the BACKGROUND_QUEUE_SIZE background slots, taken without waiting; raises Busy if none is free."""
+    if not _background_slots.acquire(blocking=False):
+        raise Busy(f"Too many expensive searches in progress, at most {BACKGROUND_QUEUE_SIZE} are admitted at once.")
+    try:
+        yield
+    finally:
+        _background_slots.release()
+
+
+def timed_out():
+    return Busy(f"Expensive search did not finish within {BACKGROUND_TIMEOUT:g} seconds.")
+
+
+def run_in_background(function):
+    """Runs a picklable call in the background pool and waits for its result.
+
+    Raises Busy if no slot is free or the call takes longer than BACKGROUND_TIMEOUT.
+    """
+    with background_slot():
+        future = workers.background_executor().submit(function)
+        try:
+            return future.result(timeout=BACKGROUND_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise timed_out()
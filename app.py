@@ -1,9 +1,17 @@
 import logging
 import json
-from utils import translate_date_to_words
+import os
+from functools import lru_cache, partial
+from utils import translate_date_to_words, date_gematria, load_date_table
 from gematria import calculate_gematria, strip_diacritics
+import admission
 import torah
-from flask import Flask, request, jsonify
+import finder
+import corpus
+import metrics
+import translation
+from response_cache import CachedResponse, create_response_cache, make_etag, make_key
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from datetime import datetime
 
 # Set logging level to WARNING
@@ -12,51 +20,417 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Default ELS search parameters
+DEFAULT_SEARCH = {
+    "start": 1,
+    "end": 39,
+    "rounds": "1,-1",
+    "length": 0,
+    "strip_spaces": True,
+    "strip_in_braces": True,
+    "strip_diacritics_chk": True,
+}
+
+# Maximum number of queries accepted by /els_search/batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+
+# Maximum number of steps a single /els_search/sweep request may cover
+MAX_SWEEP_STEPS = int(os.environ.get("MAX_SWEEP_STEPS", "100000"))
+
+# Highest skip a /els_search/find request may search
+MAX_FIND_SKIP = int(os.environ.get("MAX_FIND_SKIP", "10000"))
+
+# Maximum number of rounds an /els_search request may list
+MAX_ROUNDS = int(os.environ.get("MAX_ROUNDS", "20"))
+
+# Seconds a client is asked to wait when all background slots are taken
+BUSY_RETRY_AFTER = 5
+
+# Bump when a code change alters /els_search responses, so cache entries shared through RESPONSE_CACHE_DIR
+# by an older deploy are not served
+RESPONSE_VERSION = 1
+
+# Cache for complete /els_search responses
+response_cache = create_response_cache()
+
+@app.before_request
+def start_timing():
+    g.timing = metrics.start_request()
+    # Opt-in sampling profile of a single request, see /profiles/<profile_id>
+    g.profiler = metrics.start_profile() if metrics.PROFILING_ENABLED and request.headers.get('X-Profile') == '1' else None
+
+@app.after_request
+def finish_timing(response):
+    server_timing = metrics.finish_request(g.pop('timing', None), request.url_rule.rule if request.url_rule else "unmatched",
+                                           request.method, response.status_code)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-Id'] = metrics.finish_profile(profiler)
+    return response
+
 # Use Flask API endpoint
 @app.route('/els_search', methods=['POST'])
 def els_search_api():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with date and name_or_topic."}), 400
     date = data.get('date')
     name_or_topic = data.get('name_or_topic')
 
     try:
         date_obj = datetime.strptime(date, '%Y-%m-%d')
-    except ValueError:
-        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."})
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
+
+    try:
+        # Optional whole-corpus mode: books start..end form one letter stream and results carry chapter and verse
+        whole_corpus = json_flag(data, 'whole_corpus', False)
+        locate_letters = json_flag(data, 'locate_letters', False)
+        # Optional average compile: the rounds of each book are folded into one text of averaged letter values
+        average_compile = json_flag(data, 'average_compile', False)
+        stream = json_flag(data, 'stream', False)
+        # Books, rounds, length and strip options default to DEFAULT_SEARCH
+        search = parse_search(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if whole_corpus and average_compile:
+        return jsonify({"error": "average_compile cannot be combined with whole_corpus."}), 400
+
+    try:
+        # Streaming mode sends the configuration at once and every book's results as soon as they are ready
+        if stream:
+            step, search_phrase = search_step(date_obj, name_or_topic)
+            # A stream is produced by the request thread, so only fast lane searches can be streamed
+            if admission.search_lane(step, search, whole_corpus, average_compile) == admission.BACKGROUND_LANE:
+                return jsonify({"error": "Search too expensive to stream, send it without stream to run it in the background."}), 400
+            return Response(stream_with_context(stream_els_search(step, search_phrase, whole_corpus, locate_letters,
+                                                                  average_compile, search)),
+                            mimetype='application/x-ndjson')
+
+        # Cached responses are sent without estimating the cost, a search is only estimated before it runs
+        key = search_key(date_obj, name_or_topic, whole_corpus, locate_letters, average_compile, search)
+        cached, status = response_cache.get_or_compute(
+            key, lambda: compute_els_search(date_obj, name_or_topic, whole_corpus, locate_letters, average_compile, search))
+    except admission.TooExpensive as e:
+        return jsonify({"error": str(e)}), 400
+    except admission.Busy as e:
+        return busy_response(e)
+    return cached_response(cached, status)
 
+def json_flag(data, name, default):
+    """Returns the boolean parameter name of a request, raises ValueError unless it is a JSON true or false."""
+    value = data.get(name, default)
+    if not isinstance(value, bool):
+        raise ValueError(f"Parameter {name} must be true or false.")
+    return value
+
+def parse_search(data):
+    """Returns the ELS search parameters of a request, DEFAULT_SEARCH for those it does not set.
+
+    Raises ValueError with a message for the client if a parameter is invalid.
+    """
+    try:
+        start = int(data.get('start', DEFAULT_SEARCH["start"]))
+        end = int(data.get('end', DEFAULT_SEARCH["end"]))
+        round_numbers = [int(round_num) for round_num in str(data.get('rounds', DEFAULT_SEARCH["rounds"])).split(',')]
+        length = int(data.get('length', DEFAULT_SEARCH["length"]))
+    except (TypeError, ValueError):
+        raise ValueError("Parameters start, end and length must be integers, rounds a comma separated list of integers.")
+    # Book 0 is the alphabet fixture of the round tests, not part of the searchable corpus
+    last_book = corpus.book_numbers()[-1]
+    if not 1 <= start <= end <= last_book:
+        raise ValueError(f"Books must satisfy 1 <= start <= end <= {last_book}.")
+    if not 1 <= len(round_numbers) <= MAX_ROUNDS or 0 in round_numbers:
+        raise ValueError(f"Rounds must be 1 to {MAX_ROUNDS} non-zero integers.")
+    if length < 0:
+        raise ValueError("Length must not be negative.")
+    return {
+        "start": start,
+        "end": end,
+        "rounds": ",".join(map(str, round_numbers)),
+        "length": length,
+        "strip_spaces": json_flag(data, 'strip_spaces', DEFAULT_SEARCH["strip_spaces"]),
+        "strip_in_braces": json_flag(data, 'strip_in_braces', DEFAULT_SEARCH["strip_in_braces"]),
+        "strip_diacritics_chk": json_flag(data, 'strip_diacritics', DEFAULT_SEARCH["strip_diacritics_chk"]),
+    }
+
+def busy_response(error):
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
+
+@lru_cache(maxsize=None)
+def cache_version():
+    """Version of what a response depends on besides the request: RESPONSE_VERSION, the books and the date table."""
+    return make_key(RESPONSE_VERSION, corpus.source_digest(), load_date_table())
+
+def search_key(date_obj, name_or_topic, whole_corpus=False, locate_letters=False, average_compile=False, search=DEFAULT_SEARCH):
+    """The response only depends on the request, the search configuration and cache_version, identical requests share one cache entry."""
+    return make_key("els_search", cache_version(), date_obj.strftime('%Y-%m-%d'), name_or_topic, whole_corpus, locate_letters,
+                    average_compile, search, translation.get_translator().backend.name)
+
+def search_step(date_obj, name_or_topic):
+    """Returns the ELS step and the search phrase of a request."""
     date_words = translate_date_to_words(date_obj)
-    gematria_sum = calculate_gematria_sum(name_or_topic, date_words)
+    step = calculate_gematria_sum(name_or_topic, date_words, date_gematria(date_obj))
+    return step, f"{date_words} {name_or_topic}"
 
-    # Default ELS search parameters
-    start = 1
-    end = 39
-    step = gematria_sum
-    rounds = "1,-1"
-    length = 0
-    strip_spaces = True
-    strip_in_braces = True
-    strip_diacritics_chk = True
+def search_call(step, search, whole_corpus=False, locate_letters=False, average_compile=False, translate=True):
+    """The ELS search of a request as a picklable call, so it can also run in a pool process."""
+    if whole_corpus:
+        return partial(torah.process_corpus, search["start"], search["end"], step, search["rounds"], search["length"], 'en',
+                       search["strip_spaces"], search["strip_in_braces"], search["strip_diacritics_chk"],
+                       translate=translate, locate_letters=locate_letters)
+    return partial(torah.process_json_files, search["start"], search["end"], step, search["rounds"], search["length"], 'en',
+                   search["strip_spaces"], search["strip_in_braces"], search["strip_diacritics_chk"], average_compile,
+                   translate=translate)
 
-    results = perform_els_search(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk)
-    search_phrase = f"{date_words} {name_or_topic}"
+def render_json(result):
+    """Serializes a result exactly like jsonify, also outside of a request."""
+    with metrics.span("serialize"), app.app_context():
+        return jsonify(result).get_data()
 
-    json_output = generate_json_dump(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, search_phrase, results)
+def compute_els_search(date_obj, name_or_topic, whole_corpus=False, locate_letters=False, average_compile=False, search=DEFAULT_SEARCH):
+    """Runs an /els_search on the lane of its estimated cost and returns the CachedResponse.
 
-    return jsonify(json.loads(json_output))
+    Raises admission.TooExpensive over the cost limit and admission.Busy if the background lane is full.
+    """
+    step, search_phrase = search_step(date_obj, name_or_topic)
+    lane = admission.search_lane(step, search, whole_corpus, average_compile)
+    run = partial(render_search, step, search_phrase, search, whole_corpus, locate_letters, average_compile)
+    if lane == admission.FAST_LANE:
+        return run()
+    # Expensive searches are searched, translated and serialized in the bounded background pool
+    return admission.run_in_background(run)
+
+def render_search(step, search_phrase, search, whole_corpus=False, locate_letters=False, average_compile=False):
+    """Searches, translates and serializes an /els_search, returns the CachedResponse."""
+    results = search_call(step, search, whole_corpus, locate_letters, average_compile)()
+    # A single serialization pass, the body is byte-identical to jsonify of the result
+    body = render_json(generate_result(step=step, search_phrase=search_phrase, results=results, whole_corpus=whole_corpus,
+                                       average_compile=average_compile, **search))
+    return CachedResponse(body, make_etag(body))
+
+def stream_els_search(step, search_phrase, whole_corpus=False, locate_letters=False, average_compile=False, search=DEFAULT_SEARCH):
+    """Yields the /els_search response as NDJSON lines: the configuration first, then one line per book.
+
+    Book lines are {"Book": number, "Results": [...]}; in whole-corpus mode there is one line per round
+    instead, {"Round": number, "Results": [...]}. Streamed responses are not cached.
+    """
+    config = generate_result(step=step, search_phrase=search_phrase, results=None, whole_corpus=whole_corpus,
+                             average_compile=average_compile, **search)["Configuration"]
+    yield json.dumps({"Configuration": config}, ensure_ascii=False) + "\n"
+
+    if whole_corpus:
+        for result in perform_corpus_els_search(step=step, locate_letters=locate_letters, **search):
+            yield json.dumps({"Round": result["round"], "Results": [result]}, ensure_ascii=False) + "\n"
+        return
+    for book, results in torah.iter_json_files(search["start"], search["end"], step, search["rounds"], search["length"], 'en',
+                                               search["strip_spaces"], search["strip_in_braces"], search["strip_diacritics_chk"],
+                                               average_compile):
+        yield json.dumps({"Book": book, "Results": results}, ensure_ascii=False) + "\n"
+
+def cached_response(cached, status):
+    """Sends a cached body, or 304 Not Modified if the client already holds it (If-None-Match)."""
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        response = Response(cached.body, mimetype='application/json')
+    response.set_etag(cached.etag)
+    response.headers['X-Cache'] = status.upper()
+    return response
+
+@app.route('/els_search/batch', methods=['POST'])
+def els_search_batch_api():
+    data = request.get_json()
+    queries = data.get('queries') if isinstance(data, dict) else data
+    if not isinstance(queries, list):
+        return jsonify({"error": "Expected a JSON array of queries."}), 400
+    if len(queries) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Too many queries, at most {MAX_BATCH_SIZE} are allowed per batch."}), 400
+
+    # Resolve every query to its step first, identical dates are converted once
+    date_words_per_date = {}
+    prepared = []
+    for query in queries:
+        if not isinstance(query, dict):
+            prepared.append({"error": "Each query must be an object with date and name_or_topic."})
+            continue
+        date = query.get('date')
+        name_or_topic = query.get('name_or_topic')
+        try:
+            date_obj = datetime.strptime(date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            prepared.append({"error": "Invalid date format. Please use YYYY-MM-DD."})
+            continue
+        if date not in date_words_per_date:
+            date_words_per_date[date] = translate_date_to_words(date_obj)
+        date_words = date_words_per_date[date]
+        prepared.append({
+            "step": calculate_gematria_sum(name_or_topic, date_words, date_gematria(date_obj)),
+            "search_phrase": f"{date_words} {name_or_topic}",
+        })
+
+    # The distinct steps are estimated like single searches, an expensive batch runs in the background pool
+    steps = [item["step"] for item in prepared if "step" in item]
+    try:
+        lane = admission.lane(admission.batch_cost(steps, DEFAULT_SEARCH))
+        if lane == admission.FAST_LANE:
+            body = render_batch(prepared)
+        else:
+            body = admission.run_in_background(partial(render_batch, prepared))
+    except admission.TooExpensive as e:
+        return jsonify({"error": str(e)}), 400
+    except admission.Busy as e:
+        return busy_response(e)
+    return Response(body, mimetype='application/json')
+
+def render_batch(prepared):
+    """Searches every distinct step of a batch once, spread over the process pool, and serializes the response."""
+    steps = [item["step"] for item in prepared if "step" in item]
+    results_per_step = perform_batch_els_search(steps, **DEFAULT_SEARCH)
+
+    response = []
+    for item in prepared:
+        if "error" in item:
+            response.append(item)
+        else:
+            response.append(generate_result(step=item["step"], search_phrase=item["search_phrase"],
+                                            results=results_per_step[item["step"]], **DEFAULT_SEARCH))
+    return render_json(response)
+
+@app.route('/els_search/sweep', methods=['POST'])
+def els_search_sweep_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object."}), 400
+    try:
+        step_from = int(data['step_from'])
+        step_to = int(data['step_to'])
+    except KeyError as e:
+        return jsonify({"error": f"Missing parameter {e}."}), 400
+    except (TypeError, ValueError):
+        return jsonify({"error": "Parameters step_from and step_to must be integers."}), 400
+    # Books, rounds, length and strip options are checked like those of /els_search
+    try:
+        search = parse_search(data)
+        translate = json_flag(data, 'translate', False)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    start, end, rounds, length = search["start"], search["end"], search["rounds"], search["length"]
+    strip_spaces, strip_in_braces, strip_diacritics_chk = search["strip_spaces"], search["strip_in_braces"], search["strip_diacritics_chk"]
+
+    if step_from < 1 or step_to < step_from:
+        return jsonify({"error": "Steps must satisfy 1 <= step_from <= step_to."}), 400
+    if step_to - step_from + 1 > MAX_SWEEP_STEPS:
+        return jsonify({"error": f"Too many steps, at most {MAX_SWEEP_STEPS} are allowed per sweep."}), 400
+    try:
+        admission.check_sweep(step_from, step_to, search, translate)
+    except admission.TooExpensive as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        # The configuration goes out first, then one line per step as soon as it is computed
+        config = generate_result(start, end, None, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, None, None)["Configuration"]
+        del config["Step"], config["Search Phrase"]
+        config.update({"Step From": step_from, "Step To": step_to, "Translate": translate})
+        yield json.dumps({"Configuration": config}, ensure_ascii=False) + "\n"
+        for step, results in torah.sweep_steps(step_from, step_to, start, end, rounds, length, 'en', strip_spaces,
+                                               strip_in_braces, strip_diacritics_chk, translate=translate):
+            yield json.dumps({"Step": step, "Results": results}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/els_search/find', methods=['POST'])
+def els_search_find_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('term'), str):
+        return jsonify({"error": "Expected a JSON object with a Hebrew term."}), 400
+    try:
+        min_skip = int(data.get('min_skip', 1))
+        max_skip = int(data.get('max_skip', 1000))
+        start = int(data.get('start', DEFAULT_SEARCH["start"]))
+        end = int(data.get('end', DEFAULT_SEARCH["end"]))
+        max_hits = int(data.get('max_hits', finder.DEFAULT_MAX_HITS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Parameters min_skip, max_skip, start, end and max_hits must be integers."}), 400
+    try:
+        strip_spaces = json_flag(data, 'strip_spaces', DEFAULT_SEARCH["strip_spaces"])
+        strip_in_braces = json_flag(data, 'strip_in_braces', DEFAULT_SEARCH["strip_in_braces"])
+        strip_diacritics_chk = json_flag(data, 'strip_diacritics', DEFAULT_SEARCH["strip_diacritics_chk"])
+        include_negative = json_flag(data, 'include_negative', True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Same book range as /els_search, book 0 is the alphabet fixture of the round tests
+    last_book = corpus.book_numbers()[-1]
+    if not 1 <= start <= end <= last_book:
+        return jsonify({"error": f"Books must satisfy 1 <= start <= end <= {last_book}."}), 400
+    if max_skip > MAX_FIND_SKIP:
+        return jsonify({"error": f"Skip range too wide, max_skip may be at most {MAX_FIND_SKIP}."}), 400
+    if not 1 <= max_hits <= finder.DEFAULT_MAX_HITS:
+        return jsonify({"error": f"max_hits must be between 1 and {finder.DEFAULT_MAX_HITS}."}), 400
+    try:
+        hits, truncated = finder.find_term(data['term'], start, end, min_skip, max_skip, strip_spaces, strip_in_braces,
+                                           strip_diacritics_chk, include_negative, max_hits)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    config = {
+        "Term": finder.clean_term(data['term'], strip_spaces, strip_in_braces, strip_diacritics_chk),
+        "Start Book": start,
+        "End Book": end,
+        "Min Skip": min_skip,
+        "Max Skip": max_skip,
+        "Include Negative": include_negative,
+        "Strip Spaces": strip_spaces,
+        "Strip Text in Braces": strip_in_braces,
+        "Strip Diacritics": strip_diacritics_chk,
+    }
+    return jsonify({"Configuration": config, "Hits": hits, "Truncated": truncated})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def profile_api(profile_id):
+    profile = metrics.get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Unknown or expired profile."}), 404
+    return Response(profile, mimetype='text/plain')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats_api():
+    return jsonify({
+        "response_cache": response_cache.stats(),
+        "translation_cache": translation.get_translator().stats(),
+        "corpus": corpus.cache_info(),
+    })
 
 # Helper functions
-def calculate_gematria_sum(text, date_words):
+def calculate_gematria_sum(text, date_words, date_words_gematria=None):
     combined_input = f"{text} {date_words}"
-    sum_value = calculate_gematria(strip_diacritics(combined_input))
+    with metrics.span("gematria"):
+        if date_words_gematria is None:
+            sum_value = calculate_gematria(strip_diacritics(combined_input))
+        else:
+            # Gematria adds up over words, the date part comes precomputed from the date table
+            sum_value = calculate_gematria(strip_diacritics(f"{text}")) + date_words_gematria
     logger.info(f"journal phrase: {combined_input}")
     logger.info(f"journal gematria sum: {sum_value}")
     return sum_value
 
-def perform_els_search(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk):
-    results = torah.process_json_files(start, end, step, rounds, length, 'en', strip_spaces, strip_in_braces, strip_diacritics_chk)
-    return results
+def perform_corpus_els_search(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, locate_letters=False):
+    return torah.process_corpus(start, end, step, rounds, length, 'en', strip_spaces, strip_in_braces, strip_diacritics_chk, locate_letters=locate_letters)
+
+def perform_batch_els_search(steps, start, end, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk):
+    return torah.process_steps(steps, start, end, rounds, length, 'en', strip_spaces, strip_in_braces, strip_diacritics_chk)
 
-def generate_json_dump(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, search_phrase, results):
+def generate_result(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, search_phrase, results, whole_corpus=False, average_compile=False):
     config = {
         "Start Book": start,
         "End Book": end,
@@ -69,10 +443,17 @@ def generate_json_dump(start, end, step, rounds, length, strip_spaces, strip_in_
         "Strip Diacritics": strip_diacritics_chk,
         "Search Phrase": search_phrase
     }
-    result = {
+    if whole_corpus:
+        config["Whole Corpus"] = True
+    if average_compile:
+        config["Average Compile"] = True
+    return {
         "Configuration": config,
         "Results": results
     }
+
+def generate_json_dump(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, search_phrase, results, whole_corpus=False):
+    result = generate_result(start, end, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics_chk, search_phrase, results, whole_corpus)
     return json.dumps(result, indent=4, ensure_ascii=False)
 
 # You can remove the following line if you don't need it for local testing:
@@ -0,0 +1,194 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import contextvars
+import json
+from contextlib import nullcontext
+from datetime import datetime
+from functools import partial
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_etags
+
+import admission
+import app as flask_app
+import metrics
+import torah
+import workers
+from response_cache import CachedResponse, make_etag
+
+# Every route except the plain /els_search runs on the Flask app in a thread
+wsgi_app = WsgiToAsgi(flask_app.app)
+
+# Searches in progress, identical concurrent requests await the same one
+_flights = {}
+
+
+def in_thread(loop, function, *args):
+    """Runs a blocking call in the loop's default threads with the current context, so stage timings reach Server-Timing."""
+    return loop.run_in_executor(None, partial(contextvars.copy_context().run, function, *args))
+
+
+async def in_background(loop, function, *args):
+    """Runs a call in the background pool, raises admission.Busy if it takes longer than BACKGROUND_TIMEOUT."""
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(workers.background_executor(), function, *args),
+                                      admission.BACKGROUND_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise admission.timed_out()
+
+
+def plan_search(date_obj, name_or_topic, search, whole_corpus=False, average_compile=False):
+    """Returns (step, search phrase, lane) of a search, may load and clean books for the cost estimate."""
+    step, search_phrase = flask_app.search_step(date_obj, name_or_topic)
+    return step, search_phrase, admission.search_lane(step, search, whole_corpus, average_compile)
+
+
+async def compute_els_search(date_obj, name_or_topic, whole_corpus=False, locate_letters=False, average_compile=False,
+                             search=flask_app.DEFAULT_SEARCH):
+    """Async version of app.compute_els_search.
+
+    Nothing blocking runs on the event loop: the cost estimate runs in a thread, the ELS and the serialization
+    in the executor of the search's lane, and all books are translated concurrently in between. Returns
+    (CachedResponse, complete); books whose translation timed out are listed under "Untranslated Books" and
+    such a partial response is not cached.
+    """
+    loop = asyncio.get_running_loop()
+    step, search_phrase, lane = await in_thread(loop, plan_search, date_obj, name_or_topic, search, whole_corpus, average_compile)
+    run = flask_app.search_call(step, search, whole_corpus, locate_letters, average_compile, translate=False)
+    # Expensive searches hold a background slot and use the background pool, the fast lane stays free
+    with admission.background_slot() if lane == admission.BACKGROUND_LANE else nullcontext():
+        if lane == admission.FAST_LANE:
+            executor = workers.cpu_executor()
+            results = await (in_thread(loop, run) if executor is None else loop.run_in_executor(executor, run))
+        else:
+            results = await in_background(loop, run)
+        untranslated = await torah.translate_results_async(results, 'en')
+
+        result = flask_app.generate_result(step=step, search_phrase=search_phrase, results=results, whole_corpus=whole_corpus,
+                                           average_compile=average_compile, **search)
+        if untranslated:
+            result["Untranslated Books"] = untranslated
+        if lane == admission.FAST_LANE:
+            body = await in_thread(loop, flask_app.render_json, result)
+        else:
+            body = await in_background(loop, flask_app.render_json, result)
+    return CachedResponse(body, make_etag(body)), not untranslated
+
+
+async def els_search(date_obj, name_or_topic, whole_corpus=False, locate_letters=False, average_compile=False,
+                     search=flask_app.DEFAULT_SEARCH):
+    """Returns (CachedResponse, cache status) from the response cache or a single shared computation."""
+    loop = asyncio.get_running_loop()
+    key = flask_app.search_key(date_obj, name_or_topic, whole_corpus, locate_letters, average_compile, search)
+    cached = await loop.run_in_executor(None, flask_app.response_cache.get, key)
+    if cached is not None:
+        return cached, "hit"
+
+    flight = _flights.get(key)
+    if flight is not None:
+        cached, complete = await asyncio.shield(flight)
+        return cached, "coalesced"
+    flight = _flights[key] = loop.create_task(compute_els_search(date_obj, name_or_topic, whole_corpus, locate_letters,
+                                                                 average_compile, search))
+    try:
+        cached, complete = await asyncio.shield(flight)
+    finally:
+        del _flights[key]
+    if complete:
+        await loop.run_in_executor(None, flask_app.response_cache.put, key, cached)
+    return cached, "miss" if complete else "partial"
+
+
+async def send_response(send, status, body=b"", headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def replay(body):
+    """A receive callable that hands an already read request body to the Flask app."""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    return receive
+
+
+async def els_search_api(scope, receive, send):
+    body = await read_body(receive)
+    try:
+        data = json.loads(body)
+        date_obj = datetime.strptime(data.get('date'), '%Y-%m-%d')
+    except (ValueError, TypeError, AttributeError):
+        # Malformed requests get the exact answer of the Flask app
+        return await wsgi_app(scope, replay(body), send)
+    try:
+        whole_corpus = flask_app.json_flag(data, 'whole_corpus', False)
+        locate_letters = flask_app.json_flag(data, 'locate_letters', False)
+        average_compile = flask_app.json_flag(data, 'average_compile', False)
+        stream = flask_app.json_flag(data, 'stream', False)
+        search = flask_app.parse_search(data)
+    except ValueError:
+        stream, search = False, None
+    if stream or search is None or (whole_corpus and average_compile):
+        # Streaming responses and rejected requests are produced by the Flask app
+        return await wsgi_app(scope, replay(body), send)
+
+    timing = metrics.start_request()
+    try:
+        cached, status = await els_search(date_obj, data.get('name_or_topic'), whole_corpus, locate_letters,
+                                          average_compile, search)
+    except admission.TooExpensive as e:
+        status_code, body = 400, flask_app.render_json({"error": str(e)})
+        headers = [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+    except admission.Busy as e:
+        status_code, body = 503, flask_app.render_json({"error": str(e)})
+        headers = [("Content-Type", "application/json"), ("Content-Length", str(len(body))),
+                   ("Retry-After", str(flask_app.BUSY_RETRY_AFTER))]
+    else:
+        headers = [("ETag", f'"{cached.etag}"'), ("X-Cache", status.upper())]
+        request_headers = dict(scope["headers"])
+        if parse_etags(request_headers.get(b"if-none-match", b"").decode("latin-1")).contains(cached.etag):
+            status_code, body = 304, b""
+        else:
+            status_code, body = 200, cached.body
+            headers += [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+    server_timing = metrics.finish_request(timing, "/els_search", "POST", status_code)
+    if server_timing:
+        headers.append(("Server-Timing", server_timing))
+    await send_response(send, status_code, body, headers)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            workers.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point, serve with: uvicorn asgi:app"""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/els_search" and scope["method"] == "POST":
+        return await els_search_api(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,98 @@
+"""Compares the throughput of one worker on the sync Flask path and the async ASGI path of /els_search.
+
+Translations go to a local stub that sleeps --latency seconds per call like a network round trip.
+The sync path serves the requests one after another, as a gunicorn sync worker does; the async path
+keeps --concurrency requests in flight on one event loop. Every request uses a name with a different
+gematria, so neither the response cache nor the translation cache can answer it.
+
+Usage: python benchmarks/async_throughput.py [--requests 40] [--latency 0.2] [--concurrency 10] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+
+import app  # noqa: E402
+import asgi  # noqa: E402
+import translation  # noqa: E402
+
+DATE = "1984-05-03"
+
+
+def names(first, count):
+    """Names whose gematria differ by one ("a" counts 1), so every request searches another step."""
+    return [f"benchmark {'a' * k}" for k in range(first, first + count)]
+
+
+def run_sync(names):
+    client = app.app.test_client()
+    started = time.perf_counter()
+    for name in names:
+        response = client.post('/els_search', json={"date": DATE, "name_or_topic": name})
+        assert response.status_code == 200, response.status_code
+    return time.perf_counter() - started
+
+
+async def call_asgi(name):
+    body = json.dumps({"date": DATE, "name_or_topic": name}).encode("utf-8")
+    scope = {"type": "http", "method": "POST", "path": "/els_search", "headers": [(b"content-type", b"application/json")]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.app(scope, receive, send)
+    assert messages[0]["status"] == 200, messages[0]["status"]
+
+
+def run_async(names, concurrency):
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(name):
+            async with semaphore:
+                await call_asgi(name)
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(name) for name in names))
+        return time.perf_counter() - started
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async /els_search throughput benchmark.")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per path.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds every stub translator call takes.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight on the async path.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    translation.set_translator(translation.CachedTranslator(translation.StubTranslator(latency=args.latency)))
+    # Warm up the corpus caches so both paths start from the same state
+    run_sync(names(0, 1))
+
+    report = {"requests": args.requests, "latency_s": args.latency, "concurrency": args.concurrency,
+              "translation_concurrency": translation.TRANSLATION_CONCURRENCY}
+    for path, seconds in (("sync", run_sync(names(1, args.requests))),
+                          ("async", run_async(names(1 + args.requests, args.requests), args.concurrency))):
+        report[f"{path}_seconds"] = round(seconds, 3)
+        report[f"{path}_requests_per_second"] = round(args.requests / seconds, 2)
+    report["speedup"] = round(report["async_requests_per_second"] / report["sync_requests_per_second"], 2)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"{args.requests} requests, translator latency {args.latency}s: "
+              f"sync {report['sync_requests_per_second']} req/s, async {report['async_requests_per_second']} req/s "
+              f"({report['speedup']}x, {args.concurrency} in flight)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Reads, writes and compares the machine-readable baseline files of the benchmarks.
+
+A baseline holds a "results" mapping of benchmark name to measurements. Measurements named *_us, *_ms
+or *_seconds are durations and *_mb memory sizes (lower is better), *_per_second are rates (higher is
+better); other values such as counts are informational and not compared.
+"""
+import json
+import platform
+import sys
+import time
+
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+
+def write(path, kind, results, settings=None):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"kind": kind, "environment": environment(), "settings": settings or {}, "results": results},
+                  file, indent=2, ensure_ascii=False, sort_keys=True)
+        file.write("\n")
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _direction(measurement):
+    if measurement.endswith(("_us", "_ms", "_seconds", "_mb")):
+        return 1
+    if measurement.endswith("_per_second"):
+        return -1
+    return 0
+
+
+def compare(results, baseline, threshold=1.25):
+    """Returns the regressions of results against a baseline as (benchmark, measurement, baseline, current, ratio).
+
+    A measurement regresses if it got slower (or its rate lower) by more than threshold times.
+    """
+    regressions = []
+    for name, measurements in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for measurement, value in measurements.items():
+            direction = _direction(measurement)
+            old = reference.get(measurement)
+            if not direction or not old or not value:
+                continue
+            ratio = value / old if direction > 0 else old / value
+            if ratio > threshold:
+                regressions.append((name, measurement, old, value, round(ratio, 2)))
+    return regressions
+
+
+def report_regressions(regressions, threshold):
+    """Prints the regressions and returns the exit code for the benchmark script."""
+    if not regressions:
+        print(f"No regressions beyond {threshold}x against the baseline.")
+        return 0
+    for name, measurement, old, value, ratio in regressions:
+        print(f"REGRESSION {name} {measurement}: {old} -> {value} ({ratio}x)", file=sys.stderr)
+    return 1
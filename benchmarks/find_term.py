@@ -0,0 +1,77 @@
+"""Benchmarks the ELS term finder on the full corpus (books 1-39).
+
+Reports the time to build the letter bitsets and, per term, the search time and number of hits.
+With --brute-force the naive scan is timed on the first book for comparison.
+
+Usage: python benchmarks/find_term.py [--terms משה תורה ישראל] [--max-skip 1000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus  # noqa: E402
+import finder  # noqa: E402
+
+DEFAULT_TERMS = ["משה", "תורה", "משיח", "ישראל"]
+
+
+def brute_force(text, term, min_skip, max_skip):
+    """Checks every start at every skip, forward and backward."""
+    hits = 0
+    last = len(term) - 1
+    for skip in list(range(min_skip, max_skip + 1)) + list(range(-max_skip, -min_skip + 1)):
+        for offset in range(len(text)):
+            if 0 <= offset + last * skip < len(text) and all(text[offset + j * skip] == term[j] for j in range(len(term))):
+                hits += 1
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ELS term finder benchmark.")
+    parser.add_argument("--terms", nargs="+", default=DEFAULT_TERMS, help="Hebrew terms to search.")
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--end", type=int, default=39)
+    parser.add_argument("--min-skip", type=int, default=1)
+    parser.add_argument("--max-skip", type=int, default=1000)
+    parser.add_argument("--brute-force", action="store_true", help="Also time a naive scan of the first book.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    letters = sum(len(corpus.cleaned_text(number)) for number in range(args.start, args.end + 1))
+    for number in range(args.start, args.end + 1):
+        finder.letter_bitsets(number)
+    report = {"books": f"{args.start}-{args.end}", "letters": letters,
+              "skips": f"{args.min_skip}-{args.max_skip}", "index_seconds": round(time.perf_counter() - started, 3),
+              "terms": []}
+
+    for term in args.terms:
+        started = time.perf_counter()
+        hits, truncated = finder.find_term(term, args.start, args.end, args.min_skip, args.max_skip, max_hits=10 ** 9)
+        entry = {"term": term, "hits": len(hits), "seconds": round(time.perf_counter() - started, 3)}
+        if args.brute_force:
+            text = corpus.cleaned_text(args.start)
+            started = time.perf_counter()
+            entry["brute_force_first_book_hits"] = brute_force(text, finder.clean_term(term), args.min_skip, args.max_skip)
+            entry["brute_force_first_book_seconds"] = round(time.perf_counter() - started, 3)
+        report["terms"].append(entry)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"Books {report['books']}: {report['letters']} letters, skips {report['skips']}, "
+          f"index built in {report['index_seconds']} s")
+    for entry in report["terms"]:
+        line = f"  {entry['term']}: {entry['hits']} hits in {entry['seconds']} s"
+        if args.brute_force:
+            line += (f" (brute force, book {args.start} only: {entry['brute_force_first_book_hits']} hits in "
+                     f"{entry['brute_force_first_book_seconds']} s)")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Load test of /els_search under gunicorn with the stub translator.
+
+Starts gunicorn with --workers workers (or targets a running server with --url), sends --requests
+searches from --concurrency client threads and reports throughput, p50/p95/p99 latency and the
+memory of the gunicorn processes. Every request uses another name unless --same-query is given,
+and the response cache is off unless --cache is given, so each request runs a full search.
+
+With --heavy-every N every Nth request asks for HEAVY_ROUNDS, which puts it on the background lane,
+and the latencies of the cheap requests are reported apart from those of the heavy ones. Heavy requests
+answered with 503 because the background lane was full are counted as busy, not as errors.
+
+Memory is reported as the summed RSS of all gunicorn processes and, where the kernel provides it,
+the summed PSS, which splits shared pages such as the compiled corpus between the processes.
+
+Usage: python benchmarks/loadtest.py [--workers 2] [--concurrency 8] [--requests 400] [--worker-class sync]
+                                     [--heavy-every 0] [--output benchmarks/baseline_loadtest.json] [--compare ...] [--json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import baseline
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATE = "1984-05-03"
+# Thousands of laps over every book, far above the fast lane cost for any step of a ten letter name
+HEAVY_ROUNDS = "2000,-2000"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(port, workers, worker_class, threads, cache):
+    environment = dict(os.environ, TRANSLATOR_BACKEND="stub")
+    if not cache:
+        environment["RESPONSE_CACHE_SIZE"] = "0"
+    command = [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+               "--worker-class", worker_class, "--threads", str(threads), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/cache/stats")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up within {timeout}s")
+
+
+def query_names(count, same_query, seed=16):
+    """Deterministic names, different ones give different gematria and therefore different searches."""
+    if same_query:
+        return ["Hans Albert Einstein"] * count
+    generator = random.Random(seed)
+    return ["".join(generator.choices("abcdefghijklmnopqrstuvwxyz", k=10)) for _ in range(count)]
+
+
+def query_bodies(names, heavy_every=0):
+    """One /els_search body per name, every heavy_every-th asks for HEAVY_ROUNDS."""
+    bodies = []
+    for i, name in enumerate(names, start=1):
+        body = {"date": DATE, "name_or_topic": name}
+        if heavy_every and i % heavy_every == 0:
+            body["rounds"] = HEAVY_ROUNDS
+        bodies.append(body)
+    return bodies
+
+
+def run_load(host, port, bodies, concurrency):
+    """Sends every body from concurrency threads, returns (latencies in seconds, heavy latencies, errors, busy, seconds)."""
+    queue = list(reversed(bodies))
+    lock = threading.Lock()
+    latencies, heavy_latencies, errors, busy = [], [], [], []
+
+    def client():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                query = queue.pop()
+            body = json.dumps(query)
+            started = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection(host, port, timeout=120)
+                connection.request("POST", "/els_search", body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                ok = response.status == 200
+            except OSError as e:
+                ok, response = False, e
+            with lock:
+                if ok:
+                    (heavy_latencies if "rounds" in query else latencies).append(time.perf_counter() - started)
+                elif "rounds" in query and getattr(response, "status", None) == 503:
+                    busy.append(time.perf_counter() - started)
+                else:
+                    errors.append(str(getattr(response, "status", response)))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, heavy_latencies, errors, busy, time.perf_counter() - started
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _pss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def process_tree(pid):
+    """pid and all its descendants, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    parent = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def memory(pid):
+    pids = process_tree(pid)
+    rss = [_status_kb(p, "VmRSS") for p in pids]
+    pss = [_pss_kb(p) for p in pids]
+    report = {"processes": len(pids), "rss_total_mb": round(sum(v for v in rss if v) / 1024, 1),
+              "rss_max_process_mb": round(max((v for v in rss if v), default=0) / 1024, 1)}
+    if all(v is not None for v in pss):
+        report["pss_total_mb"] = round(sum(pss) / 1024, 1)
+    return report
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of /els_search under gunicorn.")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class, e.g. sync or gthread.")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per worker for the gthread worker class.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client threads sending requests.")
+    parser.add_argument("--requests", type=int, default=400, help="Total number of requests.")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring.")
+    parser.add_argument("--same-query", action="store_true", help="Send the same search every time.")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache enabled.")
+    parser.add_argument("--heavy-every", type=int, default=0, help="Make every Nth request a heavy background lane search.")
+    parser.add_argument("--url", help="Target a running server instead of starting gunicorn, memory is not reported.")
+    parser.add_argument("--output", help="Write the results to this baseline file.")
+    parser.add_argument("--compare", help="Compare the results with this baseline file, exit 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown factor that counts as a regression.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = start_gunicorn(port, args.workers, args.worker_class, args.threads, args.cache)
+    try:
+        wait_until_ready(host, port)
+        bodies = query_bodies(query_names(args.warmup + args.requests, args.same_query), args.heavy_every)
+        run_load(host, port, bodies[:args.warmup], args.concurrency)
+        latencies, heavy_latencies, errors, busy, seconds = run_load(host, port, bodies[args.warmup:], args.concurrency)
+        mem = memory(server.pid) if server is not None else {}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    name = f"loadtest[workers={args.workers},class={args.worker_class},threads={args.threads},concurrency={args.concurrency}"
+    name += f",heavy_every={args.heavy_every}]" if args.heavy_every else "]"
+    result = {
+        "requests": len(latencies) + len(heavy_latencies),
+        "errors": len(errors),
+        "throughput_per_second": round((len(latencies) + len(heavy_latencies)) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+    }
+    if heavy_latencies or busy:
+        # The p* and mean measurements above only cover the cheap requests
+        result.update({"heavy_requests": len(heavy_latencies), "heavy_busy": len(busy)})
+    if heavy_latencies:
+        result.update({
+                       "heavy_p50_ms": round(percentile(heavy_latencies, 0.50) * 1000, 2),
+                       "heavy_p99_ms": round(percentile(heavy_latencies, 0.99) * 1000, 2)})
+    result.update(mem)
+    results = {name: result}
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{name}: {result['throughput_per_second']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+              f"p99 {result['p99_ms']} ms, {result['errors']} errors"
+              + (f", RSS {result['rss_total_mb']} MB in {result['processes']} processes" if mem else "")
+              + (f", PSS {result['pss_total_mb']} MB" if "pss_total_mb" in mem else "")
+              + (f"; {result['heavy_requests']} heavy requests p50 {result['heavy_p50_ms']} ms, p99 {result['heavy_p99_ms']} ms"
+                 if heavy_latencies else "")
+              + (f", {result['heavy_busy']} heavy requests busy" if busy else ""))
+    if args.output:
+        baseline.write(args.output, "loadtest", results, {key: value for key, value in vars(args).items()
+                                                           if key not in ("output", "compare", "json")})
+    if args.compare:
+        sys.exit(baseline.report_regressions(baseline.compare(results, baseline.load(args.compare), args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Measures the cold import time of the Flask app, i.e. what every gunicorn worker pays before serving.
+
+Usage: python benchmarks/startup.py [--runs 10] [--module app] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each run imports the module in a fresh interpreter and reports the import time in seconds
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def measure_import(module, runs):
+    """Imports module in runs fresh interpreters and returns the import times in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            cwd=REPO_ROOT, check=True, capture_output=True, text=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark for the ELS service.")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters to start.")
+    parser.add_argument("--module", default="app", help="Module to import.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    timings = measure_import(args.module, args.runs)
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "min_ms": round(min(timings), 1),
+        "median_ms": round(statistics.median(timings), 1),
+        "max_ms": round(max(timings), 1),
+    }
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"import {report['module']}: min {report['min_ms']} ms, median {report['median_ms']} ms, "
+              f"max {report['max_ms']} ms over {report['runs']} runs")
+
+
+if __name__ == "__main__":
+    main()
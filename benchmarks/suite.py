@@ -0,0 +1,107 @@
+"""Micro benchmarks of the ELS pipeline, offline and deterministic with the stub translator.
+
+Covers process_json_files over step sizes, round lists, book ranges and average compile,
+calculate_gematria, average_gematria, average_compile_rounds, translate_date_to_words and
+generate_json_dump. Every case is timed with timeit: the number of calls per run is chosen to take about 0.2 s, and the per-call minimum and median
+over --repeat runs are reported in microseconds.
+
+Usage: python benchmarks/suite.py [--quick] [--filter gematria] [--output benchmarks/baseline_suite.json]
+                                  [--compare benchmarks/baseline_suite.json] [--threshold 1.25] [--json]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Translations never leave the machine, so runs are repeatable and work offline
+os.environ["TRANSLATOR_BACKEND"] = "stub"
+
+import baseline  # noqa: E402
+import app  # noqa: E402
+import torah  # noqa: E402
+from gematria import calculate_gematria, calculate_gematria_batch  # noqa: E402
+from utils import translate_date_to_words  # noqa: E402
+
+STEPS = [1, 7, 137, 5174, 50000, 2000000]
+ROUNDS = ["1", "1,-1", "1,2,-1,-2", "3,-3"]
+# Books 1-39 are part of the step and round grid
+BOOK_RANGES = [(1, 1), (1, 5), (1, 20)]
+QUICK_STEPS = [7, 5174, 2000000]
+QUICK_ROUNDS = ["1", "1,-1"]
+
+
+def cases(quick=False):
+    """Yields (name, function) for every benchmark case."""
+    for step in QUICK_STEPS if quick else STEPS:
+        for rounds in QUICK_ROUNDS if quick else ROUNDS:
+            yield (f"process_json_files[books=1-39,step={step},rounds={rounds}]",
+                   lambda step=step, rounds=rounds: torah.process_json_files(1, 39, step, rounds))
+    for start, end in BOOK_RANGES:
+        yield (f"process_json_files[books={start}-{end},step=5174,rounds=1,-1]",
+               lambda start=start, end=end: torah.process_json_files(start, end, 5174, "1,-1"))
+    for rounds in ("1,-1", "1,2,-1,-2"):
+        yield (f"process_json_files[books=1-39,step=137,rounds={rounds},average]",
+               lambda rounds=rounds: torah.process_json_files(1, 39, 137, rounds, average_compile=True))
+
+    results = torah.process_json_files(1, 39, 5174, "1,-1")
+    els_text = ''.join(result["els_result_text"] for result in results)[:1000]
+    yield "calculate_gematria[phrase]", lambda: calculate_gematria("Hans Albert Einstein sixth August two thousand twentyfour")
+    yield "calculate_gematria[els_1000]", lambda: calculate_gematria(els_text)
+    yield "calculate_gematria_batch[39_results]", lambda: calculate_gematria_batch([result["els_result_text"] for result in results])
+    yield "average_gematria[500]", lambda: torah.average_gematria(els_text[:500], els_text[500:1000])
+    yield "average_compile_rounds[4x250]", lambda: torah.average_compile_rounds([els_text[k:k + 250] for k in range(0, 1000, 250)])
+
+    yield "translate_date_to_words[en,table]", lambda: translate_date_to_words(datetime(1984, 5, 3))
+    yield "translate_date_to_words[en,live]", lambda: translate_date_to_words(datetime(1750, 5, 3))
+    yield "translate_date_to_words[de,cached]", lambda: translate_date_to_words(datetime(1984, 5, 3), 'de')
+
+    yield ("generate_json_dump[39_results]",
+           lambda: app.generate_json_dump(1, 39, 5174, "1,-1", 0, True, True, True, "phrase", results))
+
+
+def measure(function, repeat):
+    """Returns the minimum and median microseconds per call and the number of calls per run."""
+    function()  # Warm up caches and lazy imports outside of the measurement
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    runs = [seconds / number * 1e6 for seconds in timer.repeat(repeat, number)]
+    return round(min(runs), 2), round(statistics.median(runs), 2), number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ELS pipeline benchmark suite.")
+    parser.add_argument("--quick", action="store_true", help="Fewer process_json_files cases and repeats.")
+    parser.add_argument("--filter", help="Only run cases whose name contains this text.")
+    parser.add_argument("--repeat", type=int, help="Timed runs per case (default 5, 3 with --quick).")
+    parser.add_argument("--output", help="Write the results to this baseline file.")
+    parser.add_argument("--compare", help="Compare the results with this baseline file, exit 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown factor that counts as a regression.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args()
+    repeat = args.repeat or (3 if args.quick else 5)
+    logging.disable(logging.INFO)
+
+    results = {}
+    for name, function in cases(args.quick):
+        if args.filter and args.filter not in name:
+            continue
+        min_us, median_us, number = measure(function, repeat)
+        results[name] = {"min_us": min_us, "median_us": median_us, "calls_per_run": number}
+        if not args.json:
+            print(f"{name:70} min {min_us:>12.2f} us  median {median_us:>12.2f} us")
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+    if args.output:
+        baseline.write(args.output, "suite", results, {"repeat": repeat, "quick": args.quick})
+    if args.compare:
+        sys.exit(baseline.report_regressions(baseline.compare(results, baseline.load(args.compare), args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# Compiled corpus artifact, built with: python compiled_corpus.py --build
+COMPILED_CORPUS_PATH = os.environ.get(
+    "COMPILED_CORPUS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.bin"))
+
+MAGIC = b"ELSCORP\0"
+FORMAT_VERSION = 1
+# Header: magic, format version, length of the JSON index that follows
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+# One byte per character: ISO-8859-8 holds the space and all 27 Hebrew letters including final forms
+LETTER_ENCODING = "iso8859-8"
+
+# Only texts with diacritics stripped consist of letters and spaces, so only those variants are compiled
+VARIANTS = [(strip_spaces, strip_in_braces) for strip_spaces in (True, False) for strip_in_braces in (True, False)]
+
+
+def variant_key(strip_spaces, strip_in_braces):
+    return f"{int(strip_spaces)}{int(strip_in_braces)}"
+
+
+def source_files(base_path):
+    return sorted(glob.glob(os.path.join(base_path, "[0-9][0-9].json")))
+
+
+def source_digest(base_path):
+    """Digest over the names and contents of the book files, used to detect a stale artifact."""
+    digest = hashlib.sha256()
+    for path in source_files(base_path):
+        digest.update(os.path.basename(path).encode("ascii"))
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class CompiledCorpus:
+    """Read-only view of a compiled corpus file mapped into memory.
+
+    Letter streams and verse tables are memoryviews into the mapping, so every worker process
+    that opens the same file shares its pages through the OS page cache instead of holding copies.
+    """
+
+    def __init__(self, path, index, mapping):
+        self.path = path
+        self.index = index
+        self._mapping = mapping
+        self._view = memoryview(mapping)
+        self.books = {book["number"]: position for position, book in enumerate(index["books"])}
+
+    def _section(self, offset, length, format="B"):
+        section = self._view[offset:offset + length]
+        return section.cast(format) if format != "B" else section
+
+    def has_book(self, number):
+        return number in self.books
+
+    def has_variant(self, strip_spaces, strip_in_braces, strip_diacritics):
+        return strip_diacritics and variant_key(strip_spaces, strip_in_braces) in self.index["variants"]
+
+    def title(self, number):
+        return self.index["books"][self.books[number]]["title"]
+
+    def book_range(self, number, strip_spaces, strip_in_braces):
+        """(start, end) of a book's letters within the letter stream of a variant."""
+        offsets = self.index["variants"][variant_key(strip_spaces, strip_in_braces)]["book_offsets"]
+        position = self.books[number]
+        return offsets[position], offsets[position + 1]
+
+    def letters(self, start, end, strip_spaces, strip_in_braces):
+        """Letters from offset start to end of a variant's letter stream, one byte per letter."""
+        variant = self.index["variants"][variant_key(strip_spaces, strip_in_braces)]
+        return self._section(variant["letters_at"] + start, end - start)
+
+    def verse_table(self, number, strip_spaces, strip_in_braces):
+        """(offsets, chapters, verses) of a book as int memoryviews, offsets into its cleaned letters."""
+        book = self.index["books"][self.books[number]]
+        variant = self.index["variants"][variant_key(strip_spaces, strip_in_braces)]
+        length = book["verse_count"] * 4
+        offsets_at = variant["verse_offsets_at"] + book["verse_index"] * 4
+        return (self._section(offsets_at, length, "i"),
+                self._section(self.index["chapters_at"] + book["verse_index"] * 4, length, "i"),
+                self._section(self.index["verses_at"] + book["verse_index"] * 4, length, "i"))
+
+    def close(self):
+        self._view.release()
+        self._mapping.close()
+
+
+def build(path=None, base_path=None):
+    """Compiles the books in base_path into the corpus file at path and returns its index."""
+    import corpus
+    path = path or COMPILED_CORPUS_PATH
+    base_path = base_path or corpus.BASE_PATH
+    numbers = [int(os.path.basename(file_name)[:2]) for file_name in source_files(base_path)]
+    books = [corpus.load_book(number) for number in numbers]
+
+    sections = []
+    position = 0
+
+    def add_section(data):
+        nonlocal position
+        offset = position
+        sections.append(data)
+        position += len(data)
+        padding = -position % ALIGNMENT
+        if padding:
+            sections.append(b"\0" * padding)
+            position += padding
+        return offset
+
+    index = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "source_digest": source_digest(base_path),
+        "books": [],
+        "variants": {},
+    }
+    chapters, verses = array("i"), array("i")
+    for book in books:
+        index["books"].append({"number": book.number, "title": book.title,
+                               "verse_index": len(chapters), "verse_count": len(book.verses.offsets)})
+        chapters.extend(book.verses.chapters)
+        verses.extend(book.verses.verses)
+    index["chapters_at"] = add_section(chapters.tobytes())
+    index["verses_at"] = add_section(verses.tobytes())
+
+    for strip_spaces, strip_in_braces in VARIANTS:
+        letters = []
+        book_offsets = [0]
+        verse_offsets = array("i")
+        for book in books:
+            text, offsets = corpus.clean_text(book.text, strip_spaces, strip_in_braces, True, offsets=book.verses.offsets)
+            letters.append(text.encode(LETTER_ENCODING))
+            book_offsets.append(book_offsets[-1] + len(text))
+            verse_offsets.extend(offsets)
+        index["variants"][variant_key(strip_spaces, strip_in_braces)] = {
+            "letters_at": add_section(b"".join(letters)),
+            "book_offsets": book_offsets,
+            "verse_offsets_at": add_section(verse_offsets.tobytes()),
+        }
+
+    # Section offsets are relative to the data, which starts aligned right after the header and index
+    index_bytes = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    index_bytes += b" " * (-(HEADER.size + len(index_bytes)) % ALIGNMENT)
+    data_start = HEADER.size + len(index_bytes)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index_bytes)))
+        file.write(index_bytes)
+        for section in sections:
+            file.write(section)
+    os.replace(temporary_path, path)
+    logger.info(f"Compiled {len(books)} books into {path} ({data_start + position} bytes)")
+    return index
+
+
+def open_compiled(path=None, base_path=None):
+    """Maps the compiled corpus at path, or returns None if it is missing, unreadable or older than the books."""
+    path = path or COMPILED_CORPUS_PATH
+    try:
+        with open(path, "rb") as file:
+            magic, version, index_length = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                logger.warning(f"Compiled corpus {path} has an unknown format, using the JSON books.")
+                return None
+            index = json.loads(file.read(index_length))
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        logger.info(f"No compiled corpus at {path}, using the JSON books.")
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Compiled corpus {path} could not be read ({e}), using the JSON books.")
+        return None
+
+    if index["byteorder"] != sys.byteorder:
+        logger.warning(f"Compiled corpus {path} was built for another byte order, using the JSON books.")
+        mapping.close()
+        return None
+    if base_path is not None and index["source_digest"] != source_digest(base_path):
+        logger.warning(f"Compiled corpus {path} is older than the books, using the JSON books. Rebuild it with: python compiled_corpus.py --build")
+        mapping.close()
+        return None
+
+    # Section offsets in the index are relative to the start of the data, right after the padded index
+    data_start = HEADER.size + index_length
+    index["chapters_at"] += data_start
+    index["verses_at"] += data_start
+    for variant in index["variants"].values():
+        variant["letters_at"] += data_start
+        variant["verse_offsets_at"] += data_start
+    return CompiledCorpus(path, index, mapping)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compiles the books into a memory-mappable corpus file.")
+    parser.add_argument("--build", action="store_true", help="Compile the books.")
+    parser.add_argument("--check", action="store_true", help="Compare the compiled corpus with the JSON books.")
+    parser.add_argument("--output", default=COMPILED_CORPUS_PATH, help="Path of the compiled corpus.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.build:
+        build(args.output)
+    if args.check:
+        import corpus
+        compiled = open_compiled(args.output, corpus.BASE_PATH)
+        if compiled is None:
+            sys.exit(1)
+        mismatches = []
+        for number in compiled.books:
+            for strip_spaces, strip_in_braces in VARIANTS:
+                start, end = compiled.book_range(number, strip_spaces, strip_in_braces)
+                letters = bytes(compiled.letters(start, end, strip_spaces, strip_in_braces)).decode(LETTER_ENCODING)
+                book = corpus.load_book(number)
+                text, offsets = corpus.clean_text(book.text, strip_spaces, strip_in_braces, True, offsets=book.verses.offsets)
+                table = compiled.verse_table(number, strip_spaces, strip_in_braces)
+                if letters != text or list(table[0]) != list(offsets) or list(table[1]) != list(book.verses.chapters) \
+                        or list(table[2]) != list(book.verses.verses) or compiled.title(number) != book.title:
+                    mismatches.append((number, strip_spaces, strip_in_braces))
+        if mismatches:
+            logger.error(f"Compiled corpus differs from the JSON books for (book, strip_spaces, strip_in_braces): {mismatches}")
+            sys.exit(1)
+        logger.info("Compiled corpus matches the JSON books.")
+    if not (args.build or args.check):
+        parser.print_help()
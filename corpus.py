@@ -0,0 +1,285 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+
+import compiled_corpus
+import metrics
+
+BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "texts")
+
+# Upper bound for the number of cleaned book variants kept in memory.
+# 40 books times the 8 strip combinations fit comfortably; anything beyond is evicted LRU.
+CLEANED_CACHE_SIZE = int(os.environ.get("CORPUS_CACHE_SIZE", "320"))
+
+BRACES_PATTERN = re.compile(r"\[.*?\]", flags=re.DOTALL)
+NON_HEBREW_PATTERN = re.compile(r"[^\u05D0-\u05EA ]+")
+SPACES_PATTERN = re.compile(r" +")
+DOUBLE_SPACE_PATTERN = re.compile(r"  ")
+
+Book = namedtuple("Book", ["number", "title", "file_name", "text", "verses"])
+
+# Start offset of every verse in a text, with its 1-based chapter and verse number
+VerseTable = namedtuple("VerseTable", ["offsets", "chapters", "verses"])
+
+# Cleaned books start..end joined into one letter stream, offsets holds the start of each book
+CorpusText = namedtuple("CorpusText", ["text", "books", "offsets"])
+
+Location = namedtuple("Location", ["book", "chapter", "verse"])
+
+# Encoding of compiled corpus letters, see letters()
+LETTER_ENCODING = compiled_corpus.LETTER_ENCODING
+
+
+def book_path(number):
+    return os.path.join(BASE_PATH, f"{number:02}.json")
+
+
+@lru_cache(maxsize=None)
+def book_numbers():
+    """Numbers of all books in BASE_PATH, in ascending order."""
+    return tuple(int(os.path.basename(file_name)[:2]) for file_name in compiled_corpus.source_files(BASE_PATH))
+
+
+@lru_cache(maxsize=None)
+def source_digest():
+    """Digest of the book files in BASE_PATH, changes whenever a book does."""
+    return compiled_corpus.source_digest(BASE_PATH)
+
+
+@lru_cache(maxsize=None)
+def compiled():
+    """Returns the memory-mapped compiled corpus, or None if it is disabled, missing or stale."""
+    if not compiled_corpus.COMPILED_CORPUS_PATH:
+        return None
+    return compiled_corpus.open_compiled(compiled_corpus.COMPILED_CORPUS_PATH, BASE_PATH)
+
+
+def _compiled_variant(number, strip_spaces, strip_in_braces, strip_diacritics):
+    """The compiled corpus if it holds this book and strip combination, else None."""
+    compiled_books = compiled()
+    if compiled_books is not None and compiled_books.has_book(number) \
+            and compiled_books.has_variant(strip_spaces, strip_in_braces, strip_diacritics):
+        return compiled_books
+    return None
+
+
+@lru_cache(maxsize=64)
+@metrics.timed("load")
+def load_book(number):
+    """Loads a book once and joins its verse blocks into a single raw text.
+
+    Raises FileNotFoundError, json.JSONDecodeError or KeyError like a plain json.load would.
+    """
+    file_name = book_path(number)
+    with open(file_name, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    full_text = ''.join(' '.join(block) for block in data["text"])
+
+    # Record where each verse starts in the joined text
+    verses = VerseTable(array('i'), array('i'), array('i'))
+    offset = 0
+    for chapter_number, block in enumerate(data["text"], start=1):
+        for verse_number, verse in enumerate(block, start=1):
+            verses.offsets.append(offset)
+            verses.chapters.append(chapter_number)
+            verses.verses.append(verse_number)
+            offset += len(verse) + 1
+        if block:
+            offset -= 1  # No separator after the last verse of a chapter
+
+    logger.debug(f"Loaded book {number} from {file_name} ({len(full_text)} characters)")
+    return Book(number, data["title"], file_name, full_text, verses)
+
+
+def _remove_spans(text, spans, offsets):
+    """Removes the sorted, non-overlapping (start, end) spans from text and moves the offsets along.
+
+    An offset inside a removed span moves to the next character that is kept.
+    """
+    if not spans:
+        return text, offsets
+    starts = [start for start, end in spans]
+    removed_through = []
+    removed = 0
+    for start, end in spans:
+        removed += end - start
+        removed_through.append(removed)
+
+    moved = []
+    for offset in offsets:
+        i = bisect_right(starts, offset) - 1
+        if i < 0:
+            moved.append(offset)
+        elif offset < spans[i][1]:
+            moved.append(spans[i][0] - (removed_through[i] - (spans[i][1] - spans[i][0])))
+        else:
+            moved.append(offset - removed_through[i])
+
+    pieces = []
+    kept_from = 0
+    for start, end in spans:
+        pieces.append(text[kept_from:start])
+        kept_from = end
+    pieces.append(text[kept_from:])
+    return ''.join(pieces), moved
+
+
+def clean_text(text, strip_spaces=True, strip_in_braces=True, strip_diacritics=True, offsets=None):
+    """Applies the ELS cleaning rules to a raw text.
+
+    If offsets into the raw text are given, they are carried through every cleaning step and
+    (cleaned text, cleaned offsets) is returned instead of the cleaned text alone.
+    """
+    if offsets is not None:
+        if strip_in_braces:
+            text, offsets = _remove_spans(text, [match.span() for match in BRACES_PATTERN.finditer(text)], offsets)
+        if strip_diacritics:
+            text, offsets = _remove_spans(text, [match.span() for match in NON_HEBREW_PATTERN.finditer(text)], offsets)
+        if strip_spaces:
+            text, offsets = _remove_spans(text, [match.span() for match in SPACES_PATTERN.finditer(text)], offsets)
+        else:
+            # Like str.replace("  ", " "): every non-overlapping pair of spaces loses its second space
+            for _ in range(3):
+                spans = [(match.start() + 1, match.end()) for match in DOUBLE_SPACE_PATTERN.finditer(text)]
+                text, offsets = _remove_spans(text, spans, offsets)
+        return text, offsets
+
+    if strip_in_braces:
+        text = BRACES_PATTERN.sub("", text)
+    if strip_diacritics:
+        text = NON_HEBREW_PATTERN.sub("", text)
+    if strip_spaces:
+        text = text.replace(" ", "")
+    else:
+        text = text.replace("  ", " ")
+        text = text.replace("  ", " ")
+        text = text.replace("  ", " ")
+    return text
+
+
+def book_title(number):
+    """Returns the title of a book without parsing its JSON file if the compiled corpus has it."""
+    compiled_books = compiled()
+    if compiled_books is not None and compiled_books.has_book(number):
+        return compiled_books.title(number)
+    return load_book(number).title
+
+
+def letters(number, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Returns the cleaned text of a book in the cheapest form available.
+
+    From the compiled corpus this is a memoryview into the shared mapping with one byte per letter
+    (decode with LETTER_ENCODING); otherwise, e.g. with diacritics kept, it is the cleaned_text string.
+    Both support len() and slicing.
+    """
+    compiled_books = _compiled_variant(number, strip_spaces, strip_in_braces, strip_diacritics)
+    if compiled_books is None:
+        return cleaned_text(number, strip_spaces, strip_in_braces, strip_diacritics)
+    return compiled_books.letters(*compiled_books.book_range(number, strip_spaces, strip_in_braces), strip_spaces, strip_in_braces)
+
+
+@lru_cache(maxsize=None)
+def letter_count(number, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Length of the cleaned text of a book, without decoding anything if the compiled corpus has it."""
+    return len(letters(number, strip_spaces, strip_in_braces, strip_diacritics))
+
+
+@lru_cache(maxsize=CLEANED_CACHE_SIZE)
+def cleaned_text(number, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Returns the cleaned text of a book, computed once per strip option combination."""
+    compiled_books = _compiled_variant(number, strip_spaces, strip_in_braces, strip_diacritics)
+    if compiled_books is not None:
+        return bytes(letters(number, strip_spaces, strip_in_braces, strip_diacritics)).decode(LETTER_ENCODING)
+    text = load_book(number).text
+    with metrics.span("clean"):
+        return clean_text(text, strip_spaces, strip_in_braces, strip_diacritics)
+
+
+@lru_cache(maxsize=CLEANED_CACHE_SIZE)
+def verse_table(number, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Returns the VerseTable of a book with verse starts as offsets into its cleaned text.
+
+    The raw verse offsets are moved along while cleaning, so the table matches cleaned_text for the same options.
+    """
+    compiled_books = _compiled_variant(number, strip_spaces, strip_in_braces, strip_diacritics)
+    if compiled_books is not None:
+        return VerseTable(*compiled_books.verse_table(number, strip_spaces, strip_in_braces))
+    book = load_book(number)
+    with metrics.span("clean"):
+        text, offsets = clean_text(book.text, strip_spaces, strip_in_braces, strip_diacritics, offsets=book.verses.offsets)
+    return VerseTable(array('i', offsets), book.verses.chapters, book.verses.verses)
+
+
+def locate_in_book(number, offset, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Returns (chapter, verse) of a cleaned text offset of a book."""
+    table = verse_table(number, strip_spaces, strip_in_braces, strip_diacritics)
+    # Verses that were cleaned away entirely share their offset with the next verse, the last one wins
+    i = max(bisect_right(table.offsets, offset) - 1, 0)
+    return table.chapters[i], table.verses[i]
+
+
+@lru_cache(maxsize=8)
+def corpus_text(start, end, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Joins the cleaned texts of books start..end into one continuous letter stream.
+
+    The compiled corpus stores the books back to back, so there the stream is a slice of the mapping.
+    """
+    books = list(range(start, end + 1))
+    compiled_books = compiled()
+    if books and all(_compiled_variant(number, strip_spaces, strip_in_braces, strip_diacritics) for number in books) \
+            and [compiled_books.books[number] for number in books] == list(range(compiled_books.books[start], compiled_books.books[end] + 1)):
+        first, _ = compiled_books.book_range(start, strip_spaces, strip_in_braces)
+        offsets = array('i', (compiled_books.book_range(number, strip_spaces, strip_in_braces)[0] - first for number in books))
+        _, last = compiled_books.book_range(end, strip_spaces, strip_in_braces)
+        return CorpusText(compiled_books.letters(first, last, strip_spaces, strip_in_braces), books, offsets)
+    texts = [cleaned_text(number, strip_spaces, strip_in_braces, strip_diacritics) for number in books]
+    offsets = array('i')
+    offset = 0
+    for text in texts:
+        offsets.append(offset)
+        offset += len(text)
+    return CorpusText(''.join(texts), books, offsets)
+
+
+def locate(stream, offset, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Maps an offset in a CorpusText built with the same strip options back to its book, chapter and verse."""
+    i = max(bisect_right(stream.offsets, offset) - 1, 0)
+    book = stream.books[i]
+    chapter, verse = locate_in_book(book, offset - stream.offsets[i], strip_spaces, strip_in_braces, strip_diacritics)
+    return Location(book, chapter, verse)
+
+
+def locate_many(stream, positions, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Like locate for many offsets at once, returning [book, chapter, verse] lists."""
+    tables = [verse_table(number, strip_spaces, strip_in_braces, strip_diacritics) for number in stream.books]
+    locations = []
+    for offset in positions:
+        i = max(bisect_right(stream.offsets, offset) - 1, 0)
+        table = tables[i]
+        j = max(bisect_right(table.offsets, offset - stream.offsets[i]) - 1, 0)
+        locations.append([stream.books[i], table.chapters[j], table.verses[j]])
+    return locations
+
+
+def cache_info():
+    compiled_books = compiled()
+    return {"books": load_book.cache_info()._asdict(), "cleaned": cleaned_text.cache_info()._asdict(),
+            "verse_tables": verse_table.cache_info()._asdict(), "corpus_texts": corpus_text.cache_info()._asdict(),
+            "compiled": compiled_books.path if compiled_books is not None else None}
+
+
+def clear_cache():
+    source_digest.cache_clear()
+    compiled.cache_clear()
+    load_book.cache_clear()
+    cleaned_text.cache_clear()
+    letter_count.cache_clear()
+    verse_table.cache_clear()
+    corpus_text.cache_clear()
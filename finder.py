@@ -0,0 +1,120 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from functools import lru_cache, partial
+
+import corpus
+import workers
+
+# Hard cap on hits returned per search, short terms at wide skip ranges match almost everywhere
+DEFAULT_MAX_HITS = 10000
+
+
+@lru_cache(maxsize=80)
+def letter_bitsets(number, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Returns the position index of a book's cleaned text as {letter: bitset}, built once per strip combination.
+
+    Bit i of a letter's bitset is set if the cleaned text has that letter at offset i.
+    """
+    text = corpus.letters(number, strip_spaces, strip_in_braces, strip_diacritics)
+    if not isinstance(text, str):
+        # Compiled corpus letters already have one byte per letter
+        codes = bytes(text)
+        return {bytes([code]).decode(corpus.LETTER_ENCODING): _bitset(codes, code) for code in set(codes)}
+    letters = sorted(set(text))
+    if len(letters) > 256:
+        # Too many distinct characters for a one byte encoding, translate the text once per letter
+        return {letter: int(text.translate({ord(other): "1" if other == letter else "0" for other in letters})[::-1], 2)
+                for letter in letters}
+    # Encode the text with one byte per letter once, so each bitset is a single bytes.translate
+    codes = text.translate({ord(letter): code for code, letter in enumerate(letters)}).encode('latin-1')
+    return {letter: _bitset(codes, code) for code, letter in enumerate(letters)}
+
+
+def _bitset(codes, code):
+    """Bitset of the positions of code in the one byte per letter text codes."""
+    table = bytes(b"1"[0] if other == code else b"0"[0] for other in range(256))
+    # Lowest offset becomes the lowest bit
+    return int(codes.translate(table)[::-1], 2)
+
+
+def clean_term(term, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Cleans a search term with the same rules as the corpus so it can match the cleaned text."""
+    return corpus.clean_text(term, strip_spaces, strip_in_braces, strip_diacritics)
+
+
+def _find_forward(text_length, bitsets, term, min_skip, max_skip, max_hits):
+    """Finds all (offset, skip) with text[offset + j * skip] == term[j] for min_skip <= skip <= max_skip.
+
+    For every skip the start candidates begin as the occurrences of the rarest letter of the term and are
+    narrowed by each further letter, rarest first: shifting a letter's bitset down by j * skip lines its
+    occurrences up with the starts they imply, so one AND over the whole book filters all candidates at once.
+    """
+    term_length = len(term)
+    letter_bits = [bitsets.get(letter, 0) for letter in term]
+    order = sorted(range(term_length), key=lambda j: bin(letter_bits[j]).count("1"))
+    if not letter_bits[order[0]]:
+        return []
+
+    # The highest skip that still fits the whole term into the text
+    max_skip = min(max_skip, max(text_length - 1, 0) // (term_length - 1))
+
+    hits = []
+    for skip in range(min_skip, max_skip + 1):
+        starts = -1
+        for j in order:
+            starts &= letter_bits[j] >> (j * skip)
+            if not starts:
+                break
+        while starts:
+            lowest = starts & -starts
+            hits.append((lowest.bit_length() - 1, skip))
+            if len(hits) >= max_hits:
+                return hits
+            starts ^= lowest
+    return hits
+
+
+def find_in_text(text_length, bitsets, term, min_skip=1, max_skip=1000, include_negative=True, max_hits=DEFAULT_MAX_HITS):
+    """Returns (offset, skip) pairs where term appears as an ELS, offset being the position of its first letter.
+
+    Negative skips read the text backward. They are found as forward hits of the reversed term,
+    whose last letter is the first letter of the backward sequence.
+    """
+    hits = _find_forward(text_length, bitsets, term, min_skip, max_skip, max_hits)
+    if include_negative and len(hits) < max_hits:
+        reversed_hits = _find_forward(text_length, bitsets, term[::-1], min_skip, max_skip, max_hits - len(hits))
+        hits.extend((offset + (len(term) - 1) * skip, -skip) for offset, skip in reversed_hits)
+    return hits
+
+
+def find_in_book(term, number, min_skip=1, max_skip=1000, strip_spaces=True, strip_in_braces=True, strip_diacritics=True, include_negative=True, max_hits=DEFAULT_MAX_HITS):
+    """Finds a cleaned term in one book and returns its hits as dicts with book, title, offset and skip."""
+    text_length = len(corpus.letters(number, strip_spaces, strip_in_braces, strip_diacritics))
+    bitsets = letter_bitsets(number, strip_spaces, strip_in_braces, strip_diacritics)
+    hits = find_in_text(text_length, bitsets, term, min_skip, max_skip, include_negative, max_hits)
+    title = corpus.book_title(number)
+    return [{"book": number, "title": title, "offset": offset, "skip": skip} for offset, skip in sorted(hits)]
+
+
+def find_term(term, start=1, end=39, min_skip=1, max_skip=1000, strip_spaces=True, strip_in_braces=True, strip_diacritics=True, include_negative=True, max_hits=DEFAULT_MAX_HITS):
+    """Finds every ELS occurrence of term in books start..end within the skip range.
+
+    Books are searched in parallel on the worker process pool. Returns the hits ordered by book
+    and offset, and whether the list was cut at max_hits.
+    """
+    term = clean_term(term, strip_spaces, strip_in_braces, strip_diacritics)
+    if len(term) < 2:
+        raise ValueError("The cleaned search term must have at least two letters.")
+    if min_skip < 1 or max_skip < min_skip:
+        raise ValueError("Skips must satisfy 1 <= min_skip <= max_skip.")
+
+    # One hit more than requested per book tells whether the result had to be cut
+    search_book = partial(find_in_book, term, min_skip=min_skip, max_skip=max_skip, strip_spaces=strip_spaces,
+                          strip_in_braces=strip_in_braces, strip_diacritics=strip_diacritics,
+                          include_negative=include_negative, max_hits=max_hits + 1)
+    hits = []
+    for book_hits in workers.map_in_pool(search_book, range(start, end + 1)):
+        hits.extend(book_hits)
+    truncated = len(hits) > max_hits
+    return hits[:max_hits], truncated
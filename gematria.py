@@ -1,28 +1,13 @@
 import unicodedata
 import logging
+from collections import Counter
 
-logger = logging.getLogger(__name__)
+import metrics
 
-def strip_diacritics(text):
-    """
-    Entfernt Diakritika von Unicode-Zeichen, um den Basisbuchstaben zu erhalten, und gibt Warnungen
-    für tatsächlich unbekannte Zeichen aus.
-    """
-    stripped_text = ''
-    for char in unicodedata.normalize('NFD', text):
-        if unicodedata.category(char) not in ['Mn', 'Cf']:
-            stripped_text += char
-        else:
-            logger.info(f"Info: Diakritisches Zeichen '{char}' wird ignoriert.")
-    return stripped_text
+logger = logging.getLogger(__name__)
 
-def letter_to_value(letter):
-    """
-    Konvertiert einen einzelnen Buchstaben in seinen Gematria-Wert, ignoriert Leerzeichen
-    und Nicht-Buchstaben-Zeichen.
-    """
-    # Dein vorhandenes Wörterbuch bleibt unverändert
-    values = {
+# Gematria-Werte aller unterstützten Buchstaben
+GEMATRIA_VALUES = {
     # Lateinische Buchstaben
     'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5, 'f': 6, 'g': 7, 'h': 8, 'i': 9, 'j': 600,
     'k': 10, 'l': 20, 'm': 30, 'n': 40, 'o': 50, 'p': 60, 'q': 70, 'r': 80, 's': 90,
@@ -78,21 +63,83 @@ def letter_to_value(letter):
     'Σ': 200, 'Τ': 300, 'Υ': 400, 'Φ': 500, 'Χ': 600, 'Ψ': 700, 'Ω': 800, 'Ϡ': 900,
     'σ': 200,  # Sigma
     'ς': 200,  # Final Sigma
-    }
+}
 
-    # Stelle sicher, dass Diakritika entfernt werden, bevor auf das Wörterbuch zugegriffen wird
-    letter_no_diacritics = strip_diacritics(letter)
 
-    if letter_no_diacritics in values:
-        return values[letter_no_diacritics.lower()]
+def strip_diacritics(text):
+    """
+    Entfernt Diakritika von Unicode-Zeichen, um den Basisbuchstaben zu erhalten. Ignorierte Zeichen
+    werden pro Aufruf in einer einzigen Logzeile zusammengefasst.
+    """
+    kept = []
+    ignored = []
+    for char in unicodedata.normalize('NFD', text):
+        if unicodedata.category(char) not in ['Mn', 'Cf']:
+            kept.append(char)
+        else:
+            ignored.append(char)
+    if ignored and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Info: {len(ignored)} diakritische Zeichen ignoriert: {''.join(sorted(set(ignored)))}")
+    return ''.join(kept)
+
+def _lookup_value(letter):
+    """Original per-letter rule: strip diacritics, then look the base letter up. Returns None for unknown characters."""
+    letter_no_diacritics = strip_diacritics(letter)
+    if letter_no_diacritics in GEMATRIA_VALUES:
+        return GEMATRIA_VALUES[letter_no_diacritics.lower()]
     elif letter.strip() == "":  # Ignoriere Leerzeichen und leere Zeilen
         return 0
-    else:
+    return None
+
+class _CodePointValues(dict):
+    """Code point lookup table, filled once per distinct character on first use."""
+
+    def __missing__(self, char):
+        value = _lookup_value(char)
+        if len(char) == 1:
+            self[char] = value
+        return value
+
+# Precompiled for all known letters and ASCII, any other character is resolved once on first sight
+CHAR_VALUES = _CodePointValues()
+for _char in list(GEMATRIA_VALUES) + [chr(code) for code in range(128)]:
+    CHAR_VALUES[_char]
+
+def letter_to_value(letter):
+    """
+    Konvertiert einen einzelnen Buchstaben in seinen Gematria-Wert, ignoriert Leerzeichen
+    und Nicht-Buchstaben-Zeichen.
+    """
+    value = CHAR_VALUES[letter]
+    if value is None:
         # Gib eine spezifische Warnung aus, wenn das Zeichen unbekannt ist
         logger.info(f"Warnung: Unbekanntes Zeichen '{letter}' ignoriert.")
         return 0
+    return value
 
 
 def calculate_gematria(text):
-    """Calculate the Gematria value of a given Hebrew text, ignoring spaces and non-Hebrew characters."""
-    return sum(letter_to_value(letter) for letter in text if letter.strip() != "")
+    """Calculate the Gematria value of a given Hebrew text, ignoring spaces and non-Hebrew characters.
+
+    Each distinct character is looked up once per call, unknown characters are reported in a single log line.
+    """
+    total = 0
+    unknown = []
+    for char, count in Counter(text).items():
+        value = CHAR_VALUES[char]
+        if value is None:
+            unknown.append(char)
+        else:
+            total += value * count
+    if unknown:
+        # Counted as a metric, the characters themselves are only logged for debugging
+        metrics.UNKNOWN_CHARACTERS.inc(len(unknown))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Warnung: {len(unknown)} unbekannte Zeichen ignoriert: {' '.join(repr(char) for char in unknown)}")
+    return total
+
+
+@metrics.timed("gematria")
+def calculate_gematria_batch(texts):
+    """Calculate the Gematria values of many texts at once, e.g. all per-book ELS results of a request."""
+    return [calculate_gematria(text) for text in texts]
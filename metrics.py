@@ -0,0 +1,227 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from functools import wraps
+
+# METRICS_ENABLED=0 turns every span into a shared no-op
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# PROFILING_ENABLED=1 lets single requests ask for a sampling profile with the X-Profile header
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+MAX_PROFILES = 20
+
+# Upper bounds in seconds, from cached lookups to full translations
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Per-stage durations of the current request, None outside of a measured request
+_request_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    """Prometheus histogram with one series per label value combination."""
+
+    def __init__(self, name, documentation, label_names, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in series]
+        for labels, (counts, total, count) in series:
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter without labels."""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def expose(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+STAGE_SECONDS = Histogram("els_stage_seconds", "Time spent per pipeline stage call.", ("stage",))
+REQUEST_SECONDS = Histogram("els_request_seconds", "Time to produce a response, per endpoint.", ("endpoint", "method", "status"))
+UNKNOWN_CHARACTERS = Counter("els_gematria_unknown_characters_total", "Characters without a gematria value that were ignored.")
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, UNKNOWN_CHARACTERS]
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        STAGE_SECONDS.observe((self.stage,), seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.stage] += seconds
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage):
+    """Context manager that times one stage call into els_stage_seconds and the request's Server-Timing."""
+    return _Span(stage) if METRICS_ENABLED else _NO_SPAN
+
+
+def timed(stage):
+    """Decorator version of span, the check for disabled metrics happens once at import."""
+    def decorator(function):
+        if not METRICS_ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request():
+    """Starts collecting stage timings for the current request, returns the token for finish_request."""
+    if not METRICS_ENABLED:
+        return None
+    return _request_timings.set(defaultdict(float)), time.perf_counter()
+
+
+def finish_request(started, endpoint, method, status):
+    """Records the request duration and returns its Server-Timing header value, or None."""
+    if started is None:
+        return None
+    token, started_at = started
+    total = time.perf_counter() - started_at
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    REQUEST_SECONDS.observe((endpoint, method, str(status)), total)
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def expose():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval from a background thread.
+
+    The result is in the collapsed stack format ("outer;inner;leaf count" per line) read by
+    flamegraph.pl and speedscope. Nothing runs unless a profile was requested.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.samples.items())) + "\n"
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def start_profile():
+    """Starts profiling the calling thread, returns the profiler for finish_profile."""
+    return SamplingProfiler(threading.get_ident()).start()
+
+
+def finish_profile(profiler):
+    """Stops a profiler and keeps its result for get_profile, returns the profile id."""
+    profile_id = uuid.uuid4().hex
+    collapsed = profiler.stop()
+    with _profiles_lock:
+        _profiles[profile_id] = collapsed
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+    return profile_id
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        return _profiles.get(profile_id)
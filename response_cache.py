@@ -0,0 +1,267 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# A cached response: the serialized body and its entity tag
+CachedResponse = namedtuple("CachedResponse", ["body", "etag"])
+
+
+def make_key(*parts):
+    """Builds a stable cache key from JSON-serializable request parts."""
+    normalized = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def make_etag(body):
+    """Strong entity tag of a response body, without the surrounding quotes."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class FileBackend:
+    """Shared backend storing one file per entry in a directory, visible to all workers on the host.
+
+    Each file holds the expiry timestamp and the ETag on the first two lines, then the body.
+    Expired files are deleted when read, and at most every prune_interval seconds a write prunes
+    all expired files and the oldest ones beyond max_entries.
+    """
+
+    def __init__(self, directory, max_entries=1024, prune_interval=60):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as file:
+                expires = float(file.readline())
+                etag = file.readline().rstrip(b"\n").decode("ascii")
+                body = file.read()
+        except (OSError, ValueError):
+            return None
+        if expires < time.time():
+            self._remove(self._path(key))
+            return None
+        return CachedResponse(body, etag)
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """Deletes expired entry files, then the least recently written ones beyond max_entries."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".cache"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "rb") as file:
+                    expires = float(file.readline())
+                written = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            if expires < now:
+                self._remove(path)
+            else:
+                entries.append((written, path))
+        entries.sort()
+        for written, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            self._remove(path)
+
+    def set(self, key, value, ttl):
+        # Write to a temporary file first so readers never see a partial entry
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(f"{time.time() + ttl}\n{value.etag}\n".encode("ascii"))
+                file.write(value.body)
+            os.replace(temporary_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write response cache entry {key}: {e}")
+            self._remove(temporary_path)
+        if time.time() >= self._next_prune:
+            self._next_prune = time.time() + self.prune_interval
+            self.prune()
+
+
+class _Flight:
+    """A computation in progress that concurrent identical requests wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """LRU cache with a time to live for serialized responses, with single-flight computation.
+
+    Lookups go to the in-process LRU first, then to the optional shared backend. On a miss, only the
+    first caller computes the response; identical concurrent calls wait for its result instead of
+    computing it again. The LRU holds at most maxsize entries and max_bytes of bodies; bodies over
+    max_entry_bytes are sent but not cached, neither locally nor in the backend.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, backend=None, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        # A size of 0 disables caching, also in the shared backend
+        self.backend = backend if maxsize > 0 else None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            self._bytes -= len(self._entries.pop(key)[1].body)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _cacheable(self, value):
+        return len(value.body) <= self.max_entry_bytes
+
+    def _put_local(self, key, value):
+        if not self._cacheable(value):
+            return
+        if key in self._entries:
+            self._bytes -= len(self._entries[key][1].body)
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._bytes += len(value.body)
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._bytes -= len(self._entries.popitem(last=False)[1][1].body)
+
+    def get_or_compute(self, key, compute):
+        """Returns (CachedResponse, status) where status is "hit", "miss" or "coalesced".
+
+        compute is called without arguments and must return a CachedResponse.
+        """
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self.hits += 1
+                return value, "hit"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            value = self.backend.get(key) if self.backend is not None else None
+            if value is not None:
+                status = "hit"
+                with self._lock:
+                    self.shared_hits += 1
+            else:
+                status = "miss"
+                value = compute()
+                if self.backend is not None and self._cacheable(value):
+                    self.backend.set(key, value, self.ttl)
+            with self._lock:
+                if status == "miss":
+                    self.misses += 1
+                self._put_local(key, value)
+            flight.value = value
+            return value, status
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def get(self, key):
+        """Returns the cached value or None without computing anything, for callers that compute on their own."""
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        value = self.backend.get(key) if self.backend is not None else None
+        if value is not None:
+            with self._lock:
+                self.shared_hits += 1
+                self._put_local(key, value)
+        return value
+
+    def put(self, key, value):
+        """Stores a value computed after a get that returned None, counted as a miss."""
+        if self.backend is not None and self._cacheable(value):
+            self.backend.set(key, value, self.ttl)
+        with self._lock:
+            self.misses += 1
+            self._put_local(key, value)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.shared_hits = self.misses = self.coalesced = 0
+
+
+def create_response_cache():
+    """Builds the response cache from RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES and RESPONSE_CACHE_DIR.
+
+    A size of 0 disables caching; RESPONSE_CACHE_DIR enables the file backend shared by all workers.
+    """
+    maxsize = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+    ttl = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+    max_bytes = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    max_entry_bytes = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+    directory = os.environ.get("RESPONSE_CACHE_DIR")
+    backend = FileBackend(directory, max_entries=maxsize) if directory and maxsize > 0 else None
+    return ResponseCache(maxsize=maxsize, ttl=ttl, backend=backend, max_bytes=max_bytes, max_entry_bytes=max_entry_bytes)
@@ -2,11 +2,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 import json
-import os
-import re
-from deep_translator import GoogleTranslator
-from gematria import calculate_gematria
-import math
+import random
+from bisect import bisect_left
+from itertools import product
+from gematria import calculate_gematria_batch
+import corpus
+import metrics
+import translation
+import workers
+from functools import lru_cache, partial
+from itertools import zip_longest
 
 # Hebrew gematria values for relevant characters
 gematria_values = {
@@ -18,161 +23,471 @@ gematria_values = {
 
 # Reverse dictionary for converting gematria values back to Hebrew characters
 reverse_gematria_values = {v: k for k, v in gematria_values.items()}
+# Letter values from high to low, the order in which gematria_to_string spends a value
+descending_gematria_values = sorted(reverse_gematria_values.keys(), reverse=True)
+# Highest value of a single letter and therefore of every average of letters
+max_gematria_value = max(gematria_values.values())
+
+
+class _LetterValues(dict):
+    """Gematria values by character, characters not in the dictionary count 0."""
+
+    def __missing__(self, key):
+        return 0
+
+
+letter_values = _LetterValues(gematria_values)
 
 # Function to convert a Hebrew string to its gematria values
 def string_to_gematria(s):
-    return [gematria_values.get(char, 0) for char in s]  # Handle characters not in the dictionary
+    return list(map(letter_values.__getitem__, s))
 
 # Function to convert a single gematria value to Hebrew characters
 def gematria_to_string(value):
     result = []
-    for val in sorted(reverse_gematria_values.keys(), reverse=True):
+    for val in descending_gematria_values:
         while value >= val:
             result.append(reverse_gematria_values[val])
             value -= val
     return ''.join(result)
 
+@lru_cache(maxsize=None)
+def value_strings():
+    """gematria_to_string of every value from 0 to max_gematria_value, indexed by value."""
+    return tuple(gematria_to_string(value) for value in range(max_gematria_value + 1))
+
+@lru_cache(maxsize=64)
+def average_table(count):
+    """Hebrew characters of the rounded up average for every sum of count letter values, indexed by the sum."""
+    strings = value_strings()
+    return tuple(strings[-(-total // count)] for total in range(count * max_gematria_value + 1))
+
+def average_compile_rounds(texts):
+    """Averages the gematria values of the characters at the same position over all texts in one pass.
+
+    Shorter texts are padded with 0, every average is rounded up and converted back to Hebrew characters.
+    """
+    texts = list(texts)
+    if not texts:
+        return ""
+    table = average_table(len(texts))
+    values = [map(letter_values.__getitem__, text) for text in texts]
+    sums = values[0] if len(values) == 1 else map(sum, zip_longest(*values, fillvalue=0))
+    return ''.join(map(table.__getitem__, sums))
+
 # Function to calculate the average gematria values of corresponding characters and convert them to Hebrew characters
 def average_gematria(str1, str2):
-    # Convert strings to gematria values
-    gematria1 = string_to_gematria(str1)
-    gematria2 = string_to_gematria(str2)
+    return average_compile_rounds([str1, str2])
+
+def round_length(text_length, step, round_num):
+    """Number of characters one ELS round selects from a text of text_length characters, see els_passes."""
+    if round_num == 0 or text_length == 0:
+        return 0
+    laps = abs(round_num)
+    if round_num > 0:
+        # A round is completed each time the position passes another multiple of the text length
+        return max(laps * text_length // step, laps)
+    # The first round ends when the position drops below zero, every further step completes one more
+    return max(text_length // step, 1) + laps - 1
+
+# Function to compute the text positions of a single ELS round
+def els_passes(text_length, step, round_num, limit=0):
+    """Yields the text positions of one ELS round as ranges, one per pass over the text.
+
+    Positive rounds start at index step - 1 and walk forward, negative rounds start at
+    text_length - step and walk backward, wrapping around the text between rounds. Instead of
+    stepping one character at a time, the number of selected characters is computed up front.
+    A non-zero limit stops the round after that many characters.
+    """
+    if step < 1:
+        raise ValueError(f"Step must be a positive integer, got {step}.")
+    if round_num == 0 or text_length == 0:
+        return
+
+    forward = round_num > 0
+    count = round_length(text_length, step, round_num)
+    position = step - 1 if forward else text_length - step
+    if limit:
+        count = min(count, limit)
+
+    if step > text_length:
+        # At most one character per pass, pick them directly
+        offset = step if forward else -step
+        for j in range(count):
+            position_in_text = (position + j * offset) % text_length
+            yield range(position_in_text, position_in_text + 1)
+        return
+
+    collected = 0
+    while collected < count:
+        if forward:
+            positions = range(position, text_length, step)[:count - collected]
+        else:
+            positions = range(position, -1, -step)[:count - collected]
+        yield positions
+        collected += len(positions)
+        # Continue on the next pass with the position wrapped around the text
+        if forward:
+            position += len(positions) * step - text_length
+        else:
+            position -= len(positions) * step - text_length
 
-    # Handle cases where strings have different lengths by padding with 0s
-    max_len = max(len(gematria1), len(gematria2))
-    gematria1.extend([0] * (max_len - len(gematria1)))
-    gematria2.extend([0] * (max_len - len(gematria2)))
+def select_characters(text, passes):
+    """Joins the characters at the positions yielded by els_passes, one strided slice per pass.
 
-    # Calculate the average of corresponding gematria values and apply math.ceil
-    average_gematria_values = [math.ceil((g1 + g2) / 2) for g1, g2 in zip(gematria1, gematria2)]
+    text is a string or compiled corpus letters (see corpus.letters), which are decoded after selection.
+    """
+    slices = (slice(positions.start, positions.stop if positions.stop >= 0 else None, positions.step) for positions in passes)
+    if isinstance(text, str):
+        return ''.join(text[selection] for selection in slices)
+    return b''.join(text[selection].tobytes() for selection in slices).decode(corpus.LETTER_ENCODING)
 
-    # Convert the average gematria values back to Hebrew characters
-    return ''.join(gematria_to_string(val) for val in average_gematria_values)
+# Function to select the characters of a single ELS round
+def els_round(text, step, round_num, limit=0):
+    """Selects the characters of one ELS round, see els_passes for how positions are chosen."""
+    return select_characters(text, els_passes(len(text), step, round_num, limit))
 
-def process_json_files(start, end, step, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False):
-    base_path = "texts"
-    translator = GoogleTranslator(source='auto', target=tlang)
+def process_book(i, step, rounds="1", length=0, strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False):
+    """Runs the ELS rounds over book i and returns its unscored, untranslated result.
+
+    Returns None if no characters were selected and an error dict if the book cannot be read.
+    """
+    file_name = f"texts/{i:02}.json"
+    try:
+        title = corpus.book_title(i)
+        clean_text = corpus.letters(i, strip_spaces, strip_in_braces, strip_diacritics)
+
+        text_length = len(clean_text)
+        
+        # Only the concatenated rounds are truncated to length, so extraction can stop early
+        limit = length if length > 0 and not average_compile else 0
+        collected = 0
+
+        with metrics.span("els"):
+            selected_characters_per_round = {}
+            for round_num in map(int, rounds.split(',')):
+                # Handle cases where no characters should be selected
+                if abs(round_num) == 1 and step > text_length:
+                    continue
+                # Repeated rounds select the same characters again
+                if round_num in selected_characters_per_round:
+                    continue
+                if limit and collected >= limit:
+                    break
+                selected_characters = els_round(clean_text, step, round_num, limit - collected if limit else 0)
+                selected_characters_per_round[round_num] = selected_characters
+                collected += len(selected_characters)
+
+            if average_compile and len(selected_characters_per_round) > 1:
+                # All rounds are folded into one text of averaged letters
+                result_text = average_compile_rounds(selected_characters_per_round.values())
+            else:
+                result_text = ''.join(selected_characters_per_round.values())
+
+        if length != 0:
+            result_text = result_text[:length]
+
+        if not result_text:  # Only books with selected characters have a result
+            return None
+        return {
+            "book": i,
+            "title": title,
+            "els_result_text": result_text,
+            "els_result_gematria": 0,
+            "translated_text": ""
+        }
+
+    except FileNotFoundError:
+        return {"error": f"File {file_name} not found."}
+    except json.JSONDecodeError as e:
+        return {"error": f"File {file_name} could not be read as JSON: {e}"}
+    except KeyError as e:
+        return {"error": f"Expected key 'text' is missing in {file_name}: {e}"}
+
+
+def process_json_files(start, end, step, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False, translate=True):
     results = []
+    for i in range(start, end + 1):
+        result = process_book(i, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics, average_compile)
+        if result is not None:
+            results.append(result)
+
+    score_results(results)
+    if translate:
+        translate_results(results, tlang)
+    return results
+
 
+def iter_json_files(start, end, step, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False, translate=True):
+    """Yields (book number, results) for books start..end as each book is finished.
+
+    Produces the same results as process_json_files, but every book is scored and translated on its own,
+    so the first books can be sent while later ones are still being searched.
+    """
     for i in range(start, end + 1):
-        file_name = f"{base_path}/{i:02}.json"
-        try:
-            with open(file_name, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                text_blocks = data["text"]
-
-                full_text = ""
-                for block in text_blocks:
-                    full_text += ' '.join(block)
-
-                clean_text = full_text
-                if strip_in_braces:
-                    clean_text = re.sub(r"\[.*?\]", "", clean_text, flags=re.DOTALL)
-                if strip_diacritics:
-                    clean_text = re.sub(r"[^\u05D0-\u05EA ]+", "", clean_text)
-                if strip_spaces:
-                    clean_text = clean_text.replace(" ", "")
-                else:
-                    clean_text = clean_text.replace("  ", " ")
-                    clean_text = clean_text.replace("  ", " ")
-                    clean_text = clean_text.replace("  ", " ")
-
-                text_length = len(clean_text)
-                
-                selected_characters_per_round = {}
-                for round_num in map(int, rounds.split(',')):
-                    # Handle cases where no characters should be selected
-                    if not (round_num == 1 and step > text_length) and not (round_num == -1 and step > text_length):
-                        # Corrected logic for negative rounds and step = 1
-                        if round_num > 0:
-                            current_position = step - 1 
-                        else:
-                            current_position = text_length - 1 if step == 1 else text_length - step
-
-                        completed_rounds = 0
-                        selected_characters = ""  
-
-                        while completed_rounds < abs(round_num):
-                            selected_characters += clean_text[current_position % text_length]
-
-                            # Update current_position based on the sign of rounds
-                            current_position += step if round_num > 0 else -step
-
-                            if (round_num > 0 and current_position >= text_length * (completed_rounds + 1)) or \
-                               (round_num < 0 and current_position < 0):
-                                completed_rounds += 1
-
-                        selected_characters_per_round[round_num] = selected_characters
-                
-                if average_compile and len(selected_characters_per_round) > 1:
-                    result_text = ""
-                    keys = sorted(selected_characters_per_round.keys())
-                    for i in range(len(keys) - 1):
-                        result_text = average_gematria(selected_characters_per_round[keys[i]], selected_characters_per_round[keys[i+1]])
-                else:
-                    result_text = ''.join(selected_characters_per_round.values())
+        result = process_book(i, step, rounds, length, strip_spaces, strip_in_braces, strip_diacritics, average_compile)
+        results = [result] if result is not None else []
+        score_results(results)
+        if translate:
+            translate_results(results, tlang)
+        yield i, results
+
 
-                if length != 0:
-                    result_text = result_text[:length]
+def process_corpus(start, end, step, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, translate=True, locate_letters=False):
+    """Runs the ELS over books start..end joined into one continuous letter stream, so sequences can cross book boundaries.
 
-                translated_text = translator.translate(result_text) if result_text else ""
+    Returns one result per round with the round number and the book, chapter and verse of its first letter.
+    With locate_letters every selected letter is listed as [book, chapter, verse] under locations.
+    A positive length limits the letters of all rounds together.
+    """
+    stream = corpus.corpus_text(start, end, strip_spaces, strip_in_braces, strip_diacritics)
+    strip_options = (strip_spaces, strip_in_braces, strip_diacritics)
+    text_length = len(stream.text)
+    limit = length if length > 0 else 0
+    collected = 0
 
-                if result_text:  # Only append if result_text is not empty
-                    results.append({
-                        "book": i,
-                        "title": data["title"],
-                        "els_result_text": result_text,
-                        "els_result_gematria": calculate_gematria(result_text),
-                        "translated_text": translated_text
-                    })
+    results = []
+    seen_rounds = set()
+    for round_num in map(int, rounds.split(',')):
+        # Same rules as per book: no single round when the step exceeds the text, repeated rounds count once
+        if (abs(round_num) == 1 and step > text_length) or round_num in seen_rounds:
+            continue
+        seen_rounds.add(round_num)
+        if limit and collected >= limit:
+            break
+        with metrics.span("els"):
+            passes = list(els_passes(text_length, step, round_num, limit - collected if limit else 0))
+            result_text = select_characters(stream.text, passes)
+        if not result_text:
+            continue
+        collected += len(result_text)
 
-        except FileNotFoundError:
-            results.append({"error": f"File {file_name} not found."})
-        except json.JSONDecodeError as e:
-            results.append({"error": f"File {file_name} could not be read as JSON: {e}"})
-        except KeyError as e:
-            results.append({"error": f"Expected key 'text' is missing in {file_name}: {e}"})
+        first = corpus.locate(stream, passes[0][0], *strip_options)
+        result = {
+            "round": round_num,
+            "book": first.book,
+            "title": corpus.book_title(first.book),
+            "chapter": first.chapter,
+            "verse": first.verse,
+            "els_result_text": result_text,
+            "els_result_gematria": 0,
+            "translated_text": ""
+        }
+        if locate_letters:
+            result["locations"] = corpus.locate_many(stream, (position for positions in passes for position in positions), *strip_options)
+        results.append(result)
 
+    score_results(results)
+    if translate:
+        translate_results(results, tlang)
     return results
 
 
-# Tests
-test_results = [
-    (process_json_files(0, 0, 21, rounds="3", length=0), "שרק"),
-    (process_json_files(0, 0, 22, rounds="1", length=0), "ת"), 
-    (process_json_files(0, 0, 22, rounds="3", length=0), "תתת"),
-    (process_json_files(0, 0, 23, rounds="3", length=0), "אבג"),
-    (process_json_files(0, 0, 11, rounds="1", length=0), "כת"),
-    (process_json_files(0, 0, 2, rounds="1", length=0), "בדוחילנעצרת"),
-    (process_json_files(0, 0, 23, rounds="1", length=0), None),  # Expect None, when no results
-    (process_json_files(0, 0, 23, rounds="-1", length=0), None),  # Expect None, when no results
-    (process_json_files(0, 0, 22, rounds="-1", length=0), "א"),
-    (process_json_files(0, 0, 22, rounds="-2", length=0), "אא"),
-    (process_json_files(0, 0, 1, rounds="-1", length=0), "תשרקצפעסנמלכיטחזוהדגבא"), # Reversed Hebrew alphabet
-    (process_json_files(0, 0, 1, rounds="1,-1", length=0), "אבגדהוזחטיכלמנסעפצקרשתתשרקצפעסנמלכיטחזוהדגבא"), # Combined rounds
-    (process_json_files(0, 0, 22, rounds="1,-1", length=0, average_compile=True), "רא"),  # average compile test (400+1) / 2 = math.ceil(200.5)=201=200+1="רא"
-]
+def score_results(results):
+    """Fills els_result_gematria of all book results in one batch."""
+    book_results = [result for result in results if "els_result_text" in result]
+    gematria_values = calculate_gematria_batch([result["els_result_text"] for result in book_results])
+    for result, gematria_value in zip(book_results, gematria_values):
+        result["els_result_gematria"] = gematria_value
+    return results
+
+
+def translate_results(results, tlang="en"):
+    """Fills translated_text of all book results in one translator batch, identical ELS strings are translated once."""
+    book_results = [result for result in results if "els_result_text" in result]
+    with metrics.span("translation"):
+        translations = translation.get_translator().translate_batch([result["els_result_text"] for result in book_results], tlang)
+    for result, translated_text in zip(book_results, translations):
+        result["translated_text"] = translated_text
+    return results
+
 
-all_tests_passed = True
-for result, expected in test_results:
-    if expected is None:  # Check if no result is expected
-        if not result:
-            logger.info(f"Test passed: Expected no results, got no results.")
+async def translate_results_async(results, tlang="en"):
+    """Like translate_results, but translates batches of book results concurrently, see translation.translate_batches_async.
+
+    Returns the book numbers whose translation timed out or failed, their translated_text stays empty.
+    """
+    book_results = [result for result in results if "els_result_text" in result]
+    with metrics.span("translation"):
+        translations = await translation.translate_batches_async([result["els_result_text"] for result in book_results], tlang)
+    untranslated = []
+    for result, translated_text in zip(book_results, translations):
+        if translated_text is None:
+            untranslated.append(result["book"])
         else:
-            logger.error(f"Test failed: Expected no results, but got: {result}")
-            all_tests_passed = False
+            result["translated_text"] = translated_text
+    return untranslated
+
+
+def process_steps(steps, start, end, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False, translate=True):
+    """Runs process_json_files for many steps at once and returns a dict of step -> results.
+
+    Every distinct step is extracted only once, spread over the worker process pool, and the
+    ELS strings of all steps are translated in a single batch afterwards.
+    """
+    distinct_steps = list(dict.fromkeys(steps))
+    extract = partial(process_json_files, start, end, rounds=rounds, length=length, tlang=tlang,
+                      strip_spaces=strip_spaces, strip_in_braces=strip_in_braces,
+                      strip_diacritics=strip_diacritics, average_compile=average_compile, translate=False)
+    results_per_step = dict(zip(distinct_steps, workers.map_in_pool(extract, distinct_steps)))
+    if translate:
+        translate_results([result for results in results_per_step.values() for result in results], tlang)
+    return results_per_step
+
+
+
+def sweep_steps(step_from, step_to, start, end, rounds="1", length=0, tlang="en", strip_spaces=True, strip_in_braces=True, strip_diacritics=True, average_compile=False, translate=False):
+    """Yields (step, results) for every step from step_from to step_to inclusive, one step at a time.
+
+    The cleaned books stay resident in the corpus cache, so memory only holds the results of the current
+    step no matter how wide the range is. Translation is off by default.
+    """
+    for step in range(step_from, step_to + 1):
+        results = process_json_files(start, end, step, rounds, length, tlang, strip_spaces, strip_in_braces,
+                                     strip_diacritics, average_compile, translate=False)
+        if translate:
+            translate_results(results, tlang)
+        yield step, results
+
+
+# Round logic tests against the Hebrew alphabet in texts/00.json:
+# (step, rounds, average_compile, expected ELS text or None when no result is expected)
+ROUND_TESTS = [
+    (21, "3", False, "שרק"),
+    (22, "1", False, "ת"),
+    (22, "3", False, "תתת"),
+    (23, "3", False, "אבג"),
+    (11, "1", False, "כת"),
+    (2, "1", False, "בדוחילנעצרת"),
+    (23, "1", False, None),  # Expect None, when no results
+    (23, "-1", False, None),  # Expect None, when no results
+    (22, "-1", False, "א"),
+    (22, "-2", False, "אא"),
+    (1, "-1", False, "תשרקצפעסנמלכיטחזוהדגבא"), # Reversed Hebrew alphabet
+    (1, "1,-1", False, "אבגדהוזחטיכלמנסעפצקרשתתשרקצפעסנמלכיטחזוהדגבא"), # Combined rounds
+    (22, "1,-1", True, "רא"),  # average compile test (400+1) / 2 = math.ceil(200.5)=201=200+1="רא"
+    (22, "1,2,-1", True, "רסזקלד"),  # all rounds folded: (400+400+1) / 3 = 267 = "רסז", (0+400+0) / 3 = 134 = "קלד"
+]
+
+def reference_els_round(text, step, round_num):
+    """The original character by character ELS loop, the reference els_round is checked against."""
+    text_length = len(text)
+    current_position = step - 1 if round_num > 0 else text_length - step
+    completed_rounds = 0
+    selected_characters = ""
+    while completed_rounds < abs(round_num):
+        selected_characters += text[current_position % text_length]
+        current_position += step if round_num > 0 else -step
+        if (round_num > 0 and current_position >= text_length * (completed_rounds + 1)) or \
+           (round_num < 0 and current_position < 0):
+            completed_rounds += 1
+    return selected_characters
+
+def run_reference_tests(cases=5000, seed=0):
+    """Compares els_round with reference_els_round on random texts, steps, rounds and limits."""
+    generator = random.Random(seed)
+    alphabet = ''.join(gematria_values)
+    failures = 0
+    for _ in range(cases):
+        text = ''.join(generator.choices(alphabet, k=generator.randint(1, 300)))
+        step = generator.randint(1, 400)
+        round_num = generator.choice([-1, 1]) * generator.randint(1, 5)
+        limit = generator.choice([0, generator.randint(1, 50)])
+        expected = reference_els_round(text, step, round_num)
+        expected = expected[:limit] if limit else expected
+        result = els_round(text, step, round_num, limit)
+        if result != expected:
+            logger.error(f"Test failed: els_round(len={len(text)}, step={step}, round={round_num}, limit={limit}) "
+                         f"gave '{result}', the reference loop '{expected}'")
+            failures += 1
+    if not failures:
+        logger.info(f"All {cases} reference loop tests passed.")
+    return not failures
+
+def reference_clean(text, strip_spaces=True, strip_in_braces=True, strip_diacritics=True):
+    """Applies the cleaning rules one character at a time, returns the raw text index of every kept character."""
+    kept = list(range(len(text)))
+    if strip_in_braces:
+        removed = {i for match in corpus.BRACES_PATTERN.finditer(text) for i in range(*match.span())}
+        kept = [i for i in kept if i not in removed]
+    if strip_diacritics:
+        kept = [i for i in kept if '\u05D0' <= text[i] <= '\u05EA' or text[i] == ' ']
+    if strip_spaces:
+        kept = [i for i in kept if text[i] != ' ']
     else:
-        # Check if result is not empty before accessing elements
-        if result: 
-            els_result_text = result[0]['els_result_text']
-            if els_result_text == expected:
-                logger.info(f"Test passed: Expected '{expected}', got '{els_result_text}'")
+        for _ in range(3):
+            # Like str.replace("  ", " "): the second space of every non-overlapping pair goes
+            collapsed, j = [], 0
+            while j < len(kept):
+                collapsed.append(kept[j])
+                j += 2 if j + 1 < len(kept) and text[kept[j]] == text[kept[j + 1]] == ' ' else 1
+            kept = collapsed
+    return kept
+
+def run_verse_offset_tests(books=(1, 19, 39)):
+    """Checks cleaned texts and verse tables of books for every strip combination against reference_clean.
+
+    A verse starts at its first kept character, or where the next kept one will be if it was cleaned away.
+    """
+    failures = 0
+    for number, options in product(books, product((True, False), repeat=3)):
+        book = corpus.load_book(number)
+        kept = reference_clean(book.text, *options)
+        expected_offsets = [bisect_left(kept, offset) for offset in book.verses.offsets]
+        text, offsets = corpus.clean_text(book.text, *options, offsets=book.verses.offsets)
+        if text != ''.join(book.text[i] for i in kept) or text != corpus.cleaned_text(number, *options):
+            logger.error(f"Test failed: cleaned text of book {number} with {options} differs from the reference")
+            failures += 1
+        elif list(offsets) != expected_offsets or list(corpus.verse_table(number, *options).offsets) != expected_offsets:
+            logger.error(f"Test failed: verse offsets of book {number} with {options} differ from the reference")
+            failures += 1
+    if not failures:
+        logger.info(f"All verse offset tests of books {', '.join(map(str, books))} passed.")
+    return not failures
+
+def run_round_tests():
+    """Runs the round logic test table without translating, returns True if all tests passed."""
+    all_tests_passed = True
+    for step, rounds, average_compile, expected in ROUND_TESTS:
+        result = process_json_files(0, 0, step, rounds=rounds, length=0, average_compile=average_compile, translate=False)
+        if expected is None:  # Check if no result is expected
+            if not result:
+                logger.info(f"Test passed: Expected no results, got no results.")
             else:
-                logger.error(f"Test failed: Expected '{expected}', but got '{els_result_text}'")
+                logger.error(f"Test failed: Expected no results, but got: {result}")
                 all_tests_passed = False
         else:
-            logger.error(f"Test failed: Expected '{expected}', but got no results")
-            all_tests_passed = False
+            # Check if result is not empty before accessing elements
+            if result:
+                els_result_text = result[0]['els_result_text']
+                if els_result_text == expected:
+                    logger.info(f"Test passed: Expected '{expected}', got '{els_result_text}'")
+                else:
+                    logger.error(f"Test failed: Expected '{expected}', but got '{els_result_text}'")
+                    all_tests_passed = False
+            else:
+                logger.error(f"Test failed: Expected '{expected}', but got no results")
+                all_tests_passed = False
+
+    if all_tests_passed:
+        logger.info("All round tests passed.")
+    return all_tests_passed
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Torah ELS tools.")
+    parser.add_argument("--self-test", action="store_true",
+                        help="Verify the round logic against the built-in test table and the reference loop, "
+                             "and the verse offsets against a per-character reference.")
+    args = parser.parse_args()
 
-if all_tests_passed:
-    logger.info("All round tests passed.")
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    if args.self_test:
+        passed = run_round_tests()
+        passed = run_reference_tests() and passed
+        passed = run_verse_offset_tests() and passed
+        sys.exit(0 if passed else 1)
+    parser.print_help()
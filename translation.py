@@ -0,0 +1,319 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Longest text Google accepts in a single call, deep_translator rejects 5000 characters and more
+GOOGLE_MAX_CHARS = 4999
+BATCH_SEPARATOR = "\n"
+
+# Async path: concurrent translator calls per worker, seconds each call may take and texts per call
+TRANSLATION_CONCURRENCY = int(os.environ.get("TRANSLATION_CONCURRENCY", "8"))
+TRANSLATION_TIMEOUT = float(os.environ.get("TRANSLATION_TIMEOUT", "10"))
+TRANSLATION_BATCH_SIZE = int(os.environ.get("TRANSLATION_BATCH_SIZE", "10"))
+
+
+class IdentityTranslator:
+    """Returns every text unchanged, no network access."""
+    name = "identity"
+
+    def translate_batch(self, texts, target):
+        return list(texts)
+
+
+class StubTranslator:
+    """Deterministic local translator for tests and benchmarks.
+
+    Texts found in mapping are replaced by their mapped value, everything else is returned
+    as "<target>:<text>". Every call is counted so tests can assert how often the backend was hit.
+    A latency in seconds makes every call sleep like a network round trip, for benchmarks.
+    """
+    name = "stub"
+
+    def __init__(self, mapping=None, latency=0.0):
+        self.mapping = dict(mapping or {})
+        self.latency = latency
+        self.calls = 0
+        self.texts_translated = 0
+
+    def translate_batch(self, texts, target):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.texts_translated += len(texts)
+        return [self.mapping.get(text, f"{target}:{text}") for text in texts]
+
+
+class GoogleBatchTranslator:
+    """Translates through deep_translator's GoogleTranslator.
+
+    The texts of a batch are joined with newlines and sent in as few calls as the Google length limit
+    allows. If the translation does not come back with one line per text, the affected chunk is
+    translated text by text instead. A text over the limit on its own is translated in pieces.
+    """
+    name = "google"
+
+    def __init__(self, source='auto'):
+        self.source = source
+        self._translators = {}
+
+    def _translator(self, target):
+        if target not in self._translators:
+            from deep_translator import GoogleTranslator
+            self._translators[target] = GoogleTranslator(source=self.source, target=target)
+        return self._translators[target]
+
+    def _chunks(self, texts):
+        chunk, size = [], 0
+        for text in texts:
+            if chunk and size + len(BATCH_SEPARATOR) + len(text) > GOOGLE_MAX_CHARS:
+                yield chunk
+                chunk, size = [], 0
+            size += len(text) + (len(BATCH_SEPARATOR) if chunk else 0)
+            chunk.append(text)
+        if chunk:
+            yield chunk
+
+    def _translate_text(self, translator, text):
+        """Translates one text, in pieces of at most GOOGLE_MAX_CHARS characters if it is longer."""
+        if len(text) <= GOOGLE_MAX_CHARS:
+            return translator.translate(text)
+        pieces = [text[i:i + GOOGLE_MAX_CHARS] for i in range(0, len(text), GOOGLE_MAX_CHARS)]
+        return " ".join(translator.translate(piece) or "" for piece in pieces)
+
+    def translate_batch(self, texts, target):
+        translator = self._translator(target)
+        translated = []
+        for chunk in self._chunks(texts):
+            if len(chunk) == 1:
+                translated.append(self._translate_text(translator, chunk[0]))
+                continue
+            lines = (translator.translate(BATCH_SEPARATOR.join(chunk)) or "").split(BATCH_SEPARATOR)
+            if len(lines) == len(chunk):
+                translated.extend(line.strip() for line in lines)
+            else:
+                logger.warning(f"Batch translation returned {len(lines)} lines for {len(chunk)} texts, translating one by one.")
+                translated.extend(self._translate_text(translator, text) for text in chunk)
+        return translated
+
+
+class TranslationStore:
+    """On-disk translation store in SQLite, shared by all workers pointing to the same file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(text TEXT NOT NULL, target TEXT NOT NULL, translation TEXT NOT NULL, PRIMARY KEY (text, target))"
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            self._local.connection = connection
+        return connection
+
+    def get(self, text, target):
+        row = self._connection().execute(
+            "SELECT translation FROM translations WHERE text = ? AND target = ?", (text, target)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO translations (text, target, translation) VALUES (?, ?, ?)", items
+            )
+
+
+class CachedTranslator:
+    """Wraps a backend with an LRU cache keyed by (text, target) and an optional on-disk store.
+
+    Every text is sent to the backend at most once: duplicates inside a batch are collapsed and
+    texts already in memory or on disk never reach the backend again. Texts longer than max_chars
+    are translated every time, so a few huge texts cannot fill the cache, and so are texts the backend
+    failed to translate, so a transient failure is not kept as an empty translation.
+    """
+
+    def __init__(self, backend, maxsize=10000, store=None, max_chars=5000):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.store = store
+        self.max_chars = max_chars
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        if self.store is not None:
+            value = self.store.get(*key)
+            # Stores written by older versions may hold empty translations of failed calls
+            if value:
+                self._put(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        return None
+
+    def _put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def translate(self, text, target='en'):
+        return self.translate_batch([text], target)[0]
+
+    def translate_batch(self, texts, target='en'):
+        """Translates a list of texts, returning the translations in the same order. Empty texts stay empty."""
+        translations = {}
+        missing = []
+        for text in texts:
+            if not text or text in translations:
+                continue
+            value = self._get((text, target)) if len(text) <= self.max_chars else None
+            if value is None:
+                missing.append(text)
+                translations[text] = None
+            else:
+                translations[text] = value
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            translated = self.backend.translate_batch(missing, target)
+            for text, value in zip(missing, translated):
+                translations[text] = value if value is not None else ""
+            cacheable = [text for text in missing if translations[text] and len(text) <= self.max_chars]
+            for text in cacheable:
+                self._put((text, target), translations[text])
+            if self.store is not None and cacheable:
+                self.store.put_many([(text, target, translations[text]) for text in cacheable])
+
+        return [translations.get(text, "") if text else "" for text in texts]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend.name, "size": len(self._cache), "maxsize": self.maxsize,
+                    "max_chars": self.max_chars, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+
+BACKENDS = {
+    "google": GoogleBatchTranslator,
+    "identity": IdentityTranslator,
+    "stub": StubTranslator,
+}
+
+_translator = None
+_translator_lock = threading.Lock()
+_executor = None
+_call_semaphores = weakref.WeakKeyDictionary()
+
+
+def create_translator(backend=None, maxsize=None, store_path=None):
+    """Builds a cached translator, configured from the environment where arguments are omitted.
+
+    TRANSLATOR_BACKEND selects google (default), identity or stub, TRANSLATION_CACHE_SIZE bounds the
+    in-memory cache, TRANSLATION_CACHE_MAX_CHARS is the longest text cached and TRANSLATION_CACHE_PATH
+    enables the on-disk store.
+    """
+    backend = backend or os.environ.get("TRANSLATOR_BACKEND", "google")
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown translator backend '{backend}', expected one of {', '.join(BACKENDS)}.")
+        backend = BACKENDS[backend]()
+    maxsize = maxsize if maxsize is not None else int(os.environ.get("TRANSLATION_CACHE_SIZE", "10000"))
+    store_path = store_path or os.environ.get("TRANSLATION_CACHE_PATH")
+    store = TranslationStore(store_path) if store_path else None
+    max_chars = int(os.environ.get("TRANSLATION_CACHE_MAX_CHARS", "5000"))
+    return CachedTranslator(backend, maxsize=maxsize, store=store, max_chars=max_chars)
+
+
+def get_translator():
+    """Returns the process-wide cached translator."""
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                _translator = create_translator()
+    return _translator
+
+
+def set_translator(translator):
+    """Replaces the process-wide translator, e.g. with a stub backend in tests."""
+    global _translator
+    _translator = translator
+    return translator
+
+
+def _translation_executor():
+    """Threads that run the blocking translator calls of the async path, one per allowed concurrent call."""
+    global _executor
+    if _executor is None:
+        with _translator_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TRANSLATION_CONCURRENCY, thread_name_prefix="translation")
+    return _executor
+
+
+def _call_slots(loop):
+    """Per event loop semaphore that bounds the translator calls of all requests of this worker."""
+    if loop not in _call_semaphores:
+        _call_semaphores[loop] = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
+    return _call_semaphores[loop]
+
+
+async def translate_batches_async(texts, target='en', batch_size=None, timeout=None):
+    """Translates the distinct texts in batches of batch_size, all batches concurrently.
+
+    At most TRANSLATION_CONCURRENCY translator calls run at once per worker, across all requests, and each
+    call may take timeout seconds once it has started. A call that times out keeps its slot until its thread
+    finishes, its late result still ends up in the translation cache. Texts of a batch that timed out or
+    failed come back as None.
+    """
+    batch_size = batch_size or TRANSLATION_BATCH_SIZE
+    timeout = timeout if timeout is not None else TRANSLATION_TIMEOUT
+    translator = get_translator()
+    loop = asyncio.get_running_loop()
+    slots = _call_slots(loop)
+
+    async def translate_batch(batch):
+        await slots.acquire()
+        call = loop.run_in_executor(_translation_executor(), translator.translate_batch, batch, target)
+        call.add_done_callback(lambda _: slots.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Translation of {len(batch)} texts timed out after {timeout}s")
+        except Exception as e:
+            logger.warning(f"Translation of {len(batch)} texts failed: {e}")
+        return [None] * len(batch)
+
+    distinct = list(dict.fromkeys(text for text in texts if text))
+    batches = [distinct[i:i + batch_size] for i in range(0, len(distinct), batch_size)]
+    translated = {}
+    for batch, values in zip(batches, await asyncio.gather(*(translate_batch(batch) for batch in batches))):
+        translated.update(zip(batch, values))
+    return [translated[text] if text else "" for text in texts]
@@ -1,9 +1,18 @@
 import logging
 logger = logging.getLogger(__name__)
 
-import inflect
+import json
+import os
 from datetime import datetime
-from deep_translator import GoogleTranslator
+from functools import lru_cache
+from gematria import calculate_gematria
+import metrics
+import translation
+
+# Precomputed date words, built with: python utils.py --build-date-table
+DATE_TABLE_PATH = os.environ.get("DATE_TABLE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "date_words.json"))
+DATE_TABLE_FIRST_YEAR = 1800
+DATE_TABLE_LAST_YEAR = 2200
 
 # Custom function to convert number to ordinal words
 def number_to_ordinal_word(number):
@@ -19,71 +28,76 @@ def number_to_ordinal_word(number):
     }
     return ordinal_dict.get(number, "")
 
-def custom_normalize(text):
-    mappings = {
-        'ü': 'ue', 'ö': 'oe', 'ä': 'ae', 'ß': 'ss', 'Ü': 'Ue', 'Ö': 'Oe', 'Ä': 'Ae',
-        'á': 'a', 'à': 'a', 'â': 'a', 'ã': 'a', 'å': 'aa', 'ā': 'a', 'ă': 'a', 'ą': 'a',
-        'Á': 'A', 'À': 'A', 'Â': 'A', 'Ã': 'A', 'Å': 'Aa', 'Ā': 'A', 'Ă': 'A', 'Ą': 'A',
-        'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e', 'ē': 'e', 'ĕ': 'e', 'ė': 'e', 'ę': 'e', 'ě': 'e',
-        'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E', 'Ē': 'E', 'Ĕ': 'E', 'Ė': 'E', 'Ę': 'E', 'Ě': 'E',
-        'í': 'i', 'ì': 'i', 'î': 'i', 'ï': 'i', 'ī': 'i', 'ĭ': 'i', 'į': 'i', 'ı': 'i',
-        'Í': 'I', 'Ì': 'I', 'Î': 'I', 'Ï': 'I', 'Ī': 'I', 'Ĭ': 'I', 'Į': 'I', 'I': 'I',
-        'ó': 'o', 'ò': 'o', 'ô': 'o', 'õ': 'o', 'ø': 'oe', 'ō': 'o', 'ŏ': 'o', 'ő': 'o',
-        'Ó': 'O', 'Ò': 'O', 'Ô': 'O', 'Õ': 'O', 'Ø': 'Oe', 'Ō': 'O', 'Ŏ': 'O', 'Ő': 'O',
-        'ú': 'u', 'ù': 'u', 'û': 'u', 'ū': 'u', 'ŭ': 'u', 'ů': 'u', 'ű': 'u', 'ų': 'u',
-        'Ú': 'U', 'Ù': 'U', 'Û': 'U', 'Ü': 'Ue', 'Ū': 'U', 'Ŭ': 'U', 'Ů': 'U', 'Ű': 'U', 'Ų': 'U',
-        'ç': 'c', 'ć': 'c', 'ĉ': 'c', 'ċ': 'c', 'č': 'c',
-        'Ç': 'C', 'Ć': 'C', 'Ĉ': 'C', 'Ċ': 'C', 'Č': 'C',
-        'ñ': 'n', 'ń': 'n', 'ņ': 'n', 'ň': 'n', 'ŋ': 'n',
-        'Ñ': 'N', 'Ń': 'N', 'Ņ': 'N', 'Ň': 'N', 'Ŋ': 'N',
-        'ý': 'y', 'ÿ': 'y', 'ŷ': 'y',
-        'Ý': 'Y', 'Ÿ': 'Y', 'Ŷ': 'Y',
-        'ž': 'zh', 'ź': 'z', 'ż': 'z',
-        'Ž': 'Zh', 'Ź': 'Z', 'Ż': 'Z',
-        'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'Th', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
-        'æ': 'ae', 'Æ': 'Ae', 'œ': 'oe', 'Œ': 'Oe',
-        'ś': 's', 'ŝ': 's', 'ş': 's', 'š': 's',
-        'Ś': 'S', 'Ŝ': 'S', 'Ş': 'S', 'Š': 'S',
-        'ť': 't', 'ţ': 't', 'ŧ': 't', 'Ť': 'T', 'Ţ': 'T', 'Ŧ': 'T',
-        'ŕ': 'r', 'ř': 'r', 'Ŕ': 'R', 'Ř': 'R',
-        'ľ': 'l', 'ĺ': 'l', 'ļ': 'l', 'ŀ': 'l',
-        'Ľ': 'L', 'Ĺ': 'L', 'Ļ': 'L', 'Ŀ': 'L',
-        'ē': 'e', 'Ē': 'E',
-        'ň': 'n', 'Ň': 'N',
-        'ğ': 'g', 'Ğ': 'G',
-        'ġ': 'g', 'Ġ': 'G',
-        'ħ': 'h', 'Ħ': 'H',
-        'ı': 'i', 'İ': 'I',
-        'ĵ': 'j', 'Ĵ': 'J',
-        'ķ': 'k', 'Ķ': 'K',
-        'ļ': 'l', 'Ļ': 'L',
-        'ņ': 'n', 'Ņ': 'N',
-        'ŧ': 't', 'Ŧ': 'T',
-        'ŭ': 'u', 'Ŭ': 'U'
-    }
-    for key, value in mappings.items():
-        text = text.replace(key, value)
-    return text
-
+# Replacements for special characters, applied in a single pass by custom_normalize
+NORMALIZE_MAPPINGS = {
+    'ü': 'ue', 'ö': 'oe', 'ä': 'ae', 'ß': 'ss', 'Ü': 'Ue', 'Ö': 'Oe', 'Ä': 'Ae',
+    'á': 'a', 'à': 'a', 'â': 'a', 'ã': 'a', 'å': 'aa', 'ā': 'a', 'ă': 'a', 'ą': 'a',
+    'Á': 'A', 'À': 'A', 'Â': 'A', 'Ã': 'A', 'Å': 'Aa', 'Ā': 'A', 'Ă': 'A', 'Ą': 'A',
+    'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e', 'ē': 'e', 'ĕ': 'e', 'ė': 'e', 'ę': 'e', 'ě': 'e',
+    'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E', 'Ē': 'E', 'Ĕ': 'E', 'Ė': 'E', 'Ę': 'E', 'Ě': 'E',
+    'í': 'i', 'ì': 'i', 'î': 'i', 'ï': 'i', 'ī': 'i', 'ĭ': 'i', 'į': 'i', 'ı': 'i',
+    'Í': 'I', 'Ì': 'I', 'Î': 'I', 'Ï': 'I', 'Ī': 'I', 'Ĭ': 'I', 'Į': 'I', 'I': 'I',
+    'ó': 'o', 'ò': 'o', 'ô': 'o', 'õ': 'o', 'ø': 'oe', 'ō': 'o', 'ŏ': 'o', 'ő': 'o',
+    'Ó': 'O', 'Ò': 'O', 'Ô': 'O', 'Õ': 'O', 'Ø': 'Oe', 'Ō': 'O', 'Ŏ': 'O', 'Ő': 'O',
+    'ú': 'u', 'ù': 'u', 'û': 'u', 'ū': 'u', 'ŭ': 'u', 'ů': 'u', 'ű': 'u', 'ų': 'u',
+    'Ú': 'U', 'Ù': 'U', 'Û': 'U', 'Ü': 'Ue', 'Ū': 'U', 'Ŭ': 'U', 'Ů': 'U', 'Ű': 'U', 'Ų': 'U',
+    'ç': 'c', 'ć': 'c', 'ĉ': 'c', 'ċ': 'c', 'č': 'c',
+    'Ç': 'C', 'Ć': 'C', 'Ĉ': 'C', 'Ċ': 'C', 'Č': 'C',
+    'ñ': 'n', 'ń': 'n', 'ņ': 'n', 'ň': 'n', 'ŋ': 'n',
+    'Ñ': 'N', 'Ń': 'N', 'Ņ': 'N', 'Ň': 'N', 'Ŋ': 'N',
+    'ý': 'y', 'ÿ': 'y', 'ŷ': 'y',
+    'Ý': 'Y', 'Ÿ': 'Y', 'Ŷ': 'Y',
+    'ž': 'zh', 'ź': 'z', 'ż': 'z',
+    'Ž': 'Zh', 'Ź': 'Z', 'Ż': 'Z',
+    'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'Th', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
+    'æ': 'ae', 'Æ': 'Ae', 'œ': 'oe', 'Œ': 'Oe',
+    'ś': 's', 'ŝ': 's', 'ş': 's', 'š': 's',
+    'Ś': 'S', 'Ŝ': 'S', 'Ş': 'S', 'Š': 'S',
+    'ť': 't', 'ţ': 't', 'ŧ': 't', 'Ť': 'T', 'Ţ': 'T', 'Ŧ': 'T',
+    'ŕ': 'r', 'ř': 'r', 'Ŕ': 'R', 'Ř': 'R',
+    'ľ': 'l', 'ĺ': 'l', 'ļ': 'l', 'ŀ': 'l',
+    'Ľ': 'L', 'Ĺ': 'L', 'Ļ': 'L', 'Ŀ': 'L',
+    'ē': 'e', 'Ē': 'E',
+    'ň': 'n', 'Ň': 'N',
+    'ğ': 'g', 'Ğ': 'G',
+    'ġ': 'g', 'Ġ': 'G',
+    'ħ': 'h', 'Ħ': 'H',
+    'ı': 'i', 'İ': 'I',
+    'ĵ': 'j', 'Ĵ': 'J',
+    'ķ': 'k', 'Ķ': 'K',
+    'ļ': 'l', 'Ļ': 'L',
+    'ņ': 'n', 'Ņ': 'N',
+    'ŧ': 't', 'Ŧ': 'T',
+    'ŭ': 'u', 'Ŭ': 'U'
+}
+NORMALIZE_TABLE = str.maketrans(NORMALIZE_MAPPINGS)
 
+def custom_normalize(text):
+    return text.translate(NORMALIZE_TABLE)
 
+# inflect takes seconds to import, so it is only loaded once the first date is converted
+@lru_cache(maxsize=None)
+def inflect_engine():
+    import inflect
+    return inflect.engine()
 
-# Convert a numerical date to words with an ordinal day
-def date_to_words(date_string):
-    # Create an inflect engine
-    inf_engine = inflect.engine()
-
-    date_obj = datetime.strptime(date_string, "%Y-%m-%d")
-
-    # Get year in the desired format
-    year = date_obj.year
+# Convert a year to words, 1900-1999 are read as "nineteen hundred ..."
+def year_to_words(year):
+    inf_engine = inflect_engine()
     if 1900 <= year <= 1999:
         year_words = f"{inf_engine.number_to_words(year // 100, andword='') } hundred"
         if year % 100 != 0:
             year_words += f" {inf_engine.number_to_words(year % 100, andword='')}"
     else:
         year_words = inf_engine.number_to_words(year, andword='')
-    year_formatted = year_words.replace(',', '')  # Remove commas
+    return year_words.replace(',', '')  # Remove commas
+
+# Convert a numerical date to words with an ordinal day
+def date_to_words(date_string):
+    date_obj = datetime.strptime(date_string, "%Y-%m-%d")
+
+    # Get year in the desired format
+    year_formatted = year_to_words(date_obj.year)
 
     month = date_obj.strftime("%B")  # Full month name
     day = date_obj.day
@@ -93,8 +107,68 @@ def date_to_words(date_string):
 
     return output_text
 
+def build_date_table(first_year=DATE_TABLE_FIRST_YEAR, last_year=DATE_TABLE_LAST_YEAR):
+    """Builds the date word table for first_year..last_year.
+
+    A date phrase is "<day ordinal> <month> <year words>" and gematria adds up over its words, so the
+    table only stores the words and gematria of every day, month and year instead of every date.
+    """
+    days = [number_to_ordinal_word(day) for day in range(1, 32)]
+    months = [datetime(2000, month, 1).strftime("%B") for month in range(1, 13)]
+    years = [year_to_words(year) for year in range(first_year, last_year + 1)]
+    return {
+        "first_year": first_year,
+        "last_year": last_year,
+        "days": days,
+        "day_gematria": [calculate_gematria(words) for words in days],
+        "months": months,
+        "month_gematria": [calculate_gematria(words) for words in months],
+        "years": years,
+        "year_gematria": [calculate_gematria(words) for words in years],
+    }
+
+@lru_cache(maxsize=None)
+def load_date_table(path=None):
+    """Loads the date word table once, returns None if it has not been built."""
+    try:
+        with open(path or DATE_TABLE_PATH, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        logger.warning(f"Date table {path or DATE_TABLE_PATH} not found, converting dates at request time.")
+        return None
+
+def lookup_date(date):
+    """Returns (date words, gematria of the words) from the date table, or None for dates outside of it."""
+    table = load_date_table()
+    if table is None or not table["first_year"] <= date.year <= table["last_year"]:
+        return None
+    year_index = date.year - table["first_year"]
+    words = f"{table['days'][date.day - 1]} {table['months'][date.month - 1]} {table['years'][year_index]}"
+    gematria_value = table["day_gematria"][date.day - 1] + table["month_gematria"][date.month - 1] + table["year_gematria"][year_index]
+    return words, gematria_value
 
+def date_gematria(date, lang='en'):
+    """Returns the precomputed gematria of the date words, or None if they have to be computed."""
+    if date is None or lang != 'en':
+        return None
+    entry = lookup_date(date)
+    return entry[1] if entry else None
 
+def check_date_table(table=None):
+    """Compares every date of the table with the live conversion, returns the list of mismatching dates."""
+    table = table or load_date_table()
+    mismatches = []
+    ordinal = datetime(table["first_year"], 1, 1).toordinal()
+    while ordinal <= datetime(table["last_year"], 12, 31).toordinal():
+        date = datetime.fromordinal(ordinal)
+        words, gematria_value = lookup_date(date)
+        live_words = date_to_words(date.strftime("%Y-%m-%d"))
+        if words != live_words or gematria_value != calculate_gematria(live_words):
+            mismatches.append(date.strftime("%Y-%m-%d"))
+        ordinal += 1
+    return mismatches
+
+@metrics.timed("date_words")
 def translate_date_to_words(date, lang='en'):
     """Converts a date to words in the specified language."""
     if date is None:
@@ -103,15 +177,51 @@ def translate_date_to_words(date, lang='en'):
     date_string = date.strftime("%Y-%m-%d")
     logger.info(f"Date string: {date_string}")
     
-    date_in_words = date_to_words(date_string)
+    entry = lookup_date(date)
+    date_in_words = entry[0] if entry else date_to_words(date_string)
     logger.info(f"Date in words: {date_in_words}")
     
-    translator = GoogleTranslator(source='auto', target=lang)
-    translated_date_words = translator.translate(date_in_words)
+    # The words are generated in English, only other languages need a translation
+    if lang == 'en':
+        translated_date_words = date_in_words
+    else:
+        translated_date_words = translation.get_translator().translate(date_in_words, lang)
     logger.info(f"Translated date words: {translated_date_words}")
     
     # Normalize the text if it contains any special characters
     translated_date_words = custom_normalize(translated_date_words)
     logger.info(f"Normalized date words: {translated_date_words}")
     
-    return translated_date_words
\ No newline at end of file
+    return translated_date_words
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Date word table tools.")
+    parser.add_argument("--build-date-table", action="store_true", help="Generate the date word table.")
+    parser.add_argument("--check-date-table", action="store_true", help="Compare the date word table with the live conversion.")
+    parser.add_argument("--first-year", type=int, default=DATE_TABLE_FIRST_YEAR)
+    parser.add_argument("--last-year", type=int, default=DATE_TABLE_LAST_YEAR)
+    parser.add_argument("--output", default=DATE_TABLE_PATH, help="Path of the date word table.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Unknown characters such as "-" in "twenty-one" are expected here, keep the per-word warnings out
+    logging.getLogger("gematria").setLevel(logging.WARNING)
+    if args.build_date_table:
+        table = build_date_table(args.first_year, args.last_year)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(table, file, ensure_ascii=False, separators=(",", ":"))
+        logger.info(f"Wrote date table for {args.first_year}-{args.last_year} to {args.output}")
+    if args.check_date_table:
+        load_date_table.cache_clear()
+        DATE_TABLE_PATH = args.output
+        mismatches = check_date_table()
+        if mismatches:
+            logger.error(f"{len(mismatches)} dates differ from the live conversion, first: {mismatches[:5]}")
+            sys.exit(1)
+        logger.info("Date table matches the live conversion.")
+    if not (args.build_date_table or args.check_date_table):
+        parser.print_help()
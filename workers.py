@@ -0,0 +1,93 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Processes for expensive /els_search requests, kept apart from the pool that serves cheap ones
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "1"))
+# Niceness added to the background processes, so the scheduler prefers the processes serving cheap requests
+BACKGROUND_NICE = int(os.environ.get("BACKGROUND_NICE", "10"))
+
+# Pools are created lazily from request threads, and a forked child could inherit a lock another thread holds,
+# such as a metrics or logging lock. Processes are started from a single-threaded fork server instead,
+# which has the ELS modules preloaded.
+_mp_context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+if _mp_context.get_start_method() == "forkserver":
+    _mp_context.set_forkserver_preload(["torah"])
+
+_pool = None
+_background_pool = None
+_pool_lock = threading.Lock()
+# True in the processes of the background pool
+_in_background = False
+
+
+def pool_size():
+    """Number of worker processes for CPU-bound ELS work, ELS_POOL_WORKERS or the number of cores."""
+    return int(os.environ.get("ELS_POOL_WORKERS", os.cpu_count() or 1))
+
+
+def get_process_pool():
+    """Returns the process pool of this worker, created on first use.
+
+    Pool processes start from the fork server and map the compiled corpus themselves.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                logger.info(f"Starting process pool with {pool_size()} workers")
+                _pool = ProcessPoolExecutor(max_workers=pool_size(), mp_context=_mp_context)
+    return _pool
+
+
+def map_in_pool(function, items):
+    """Maps function over items in the process pool, or inline when a pool would not pay off.
+
+    A background process maps inline as well, so expensive searches never use more than the background pool.
+    """
+    items = list(items)
+    if len(items) <= 1 or pool_size() <= 1 or _in_background:
+        return [function(item) for item in items]
+    return list(get_process_pool().map(function, items))
+
+
+def cpu_executor():
+    """Executor for CPU-bound work awaited from asyncio: the process pool, or None for the loop's default threads on one core."""
+    return get_process_pool() if pool_size() > 1 else None
+
+
+def _start_background_process():
+    global _in_background
+    _in_background = True
+    os.nice(BACKGROUND_NICE)
+
+
+def background_executor():
+    """Returns the process pool for expensive searches, created on first use.
+
+    It has BACKGROUND_WORKERS processes running at BACKGROUND_NICE, so expensive searches use at most that many
+    cores however many are admitted, and give way to cheap ones when the cores are busy.
+    """
+    global _background_pool
+    if _background_pool is None:
+        with _pool_lock:
+            if _background_pool is None:
+                logger.info(f"Starting background pool with {BACKGROUND_WORKERS} workers")
+                _background_pool = ProcessPoolExecutor(max_workers=BACKGROUND_WORKERS, mp_context=_mp_context,
+                                                       initializer=_start_background_process)
+    return _background_pool
+
+
+def shutdown():
+    global _pool, _background_pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+        if _background_pool is not None:
+            _background_pool.shutdown()
+            _background_pool = None